@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+
+
+class BathymetryGrid:
+    """
+    ETOPO-style elevation grid (meters, negative below sea level) memory-mapped
+    from a .npy file, so only the pages around the looked up points are read.
+
+    The .npy holds a 2D array with rows running north to south and columns
+    west to east. A JSON sidecar next to it (<path>.json) gives the latitude
+    and longitude of the outer rows and columns:
+    {"north": 90, "south": -90, "west": -180, "east": 180}
+    Longitudes may run -180..180 or 0..360, looked up points are wrapped to
+    the grid's convention.
+    """
+
+    def __init__(
+        self,
+        elevations: np.ndarray,
+        north: float,
+        south: float,
+        west: float,
+        east: float,
+    ):
+        if elevations.ndim != 2 or min(elevations.shape) < 2:
+            raise ValueError("bathymetry grid must be a 2D array of at least 2x2")
+
+        self.elevations = elevations
+        self.north = north
+        self.south = south
+        self.west = west
+        self.east = east
+        self.lat_step = (north - south) / (elevations.shape[0] - 1)
+        self.lon_step = (east - west) / (elevations.shape[1] - 1)
+
+    @staticmethod
+    def load(path: str) -> "BathymetryGrid":
+        with open(path + ".json") as fp:
+            extent = json.load(fp)
+
+        return BathymetryGrid(
+            np.load(path, mmap_mode="r"),
+            north=extent["north"],
+            south=extent["south"],
+            west=extent["west"],
+            east=extent["east"],
+        )
+
+    def elevations_at(self, lats, lons) -> np.ndarray:
+        """
+        Bilinearly interpolated elevation at each coordinate. Points outside
+        the grid are NaN.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        # Wrap longitudes into [west, west + 360) to match the grid's convention
+        lons = self.west + np.mod(np.asarray(lons, dtype=np.float64) - self.west, 360)
+
+        # Fractional row/column positions of every point
+        rows = (self.north - lats) / self.lat_step
+        columns = (lons - self.west) / self.lon_step
+        inside = (
+            (rows >= 0)
+            & (rows <= self.elevations.shape[0] - 1)
+            & (columns >= 0)
+            & (columns <= self.elevations.shape[1] - 1)
+        )
+        rows = np.where(inside, rows, 0)
+        columns = np.where(inside, columns, 0)
+
+        row0 = np.minimum(np.floor(rows).astype(np.int64), self.elevations.shape[0] - 2)
+        col0 = np.minimum(
+            np.floor(columns).astype(np.int64), self.elevations.shape[1] - 2
+        )
+        row_weight = rows - row0
+        col_weight = columns - col0
+
+        top = (
+            self.elevations[row0, col0] * (1 - col_weight)
+            + self.elevations[row0, col0 + 1] * col_weight
+        )
+        bottom = (
+            self.elevations[row0 + 1, col0] * (1 - col_weight)
+            + self.elevations[row0 + 1, col0 + 1] * col_weight
+        )
+        result = top * (1 - row_weight) + bottom * row_weight
+
+        return np.where(inside, result, np.nan)
@@ -4,92 +4,181 @@ import logging
 
 
 def beach_profile_and_planform(
-    beach_lat, beach_lon, fallback_slope, fallback_depth, fallback_orientation
+    beach_lat,
+    beach_lon,
+    fallback_slope,
+    fallback_depth,
+    fallback_orientation,
+    coastline=None,
+    bathymetry=None,
 ):
     try:
-        # Overpass API query to find nearest coastline
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        query = f"""
-        [out:json];
-        (
-          way(around:500,{beach_lat},{beach_lon})["natural"="coastline"];
-        );
-        out body;
-        >;
-        out skel qt;
-        """
-
-        response = requests.post(overpass_url, data=query)
-        response.raise_for_status()
-        osm_data = response.json()
-
-        # Extract nodes and coastline ways
-        nodes = {
-            elem["id"]: (elem["lat"], elem["lon"])
-            for elem in osm_data.get("elements", [])
-            if elem["type"] == "node"
-        }
-        coastline_ways = [
-            elem for elem in osm_data.get("elements", []) if elem["type"] == "way"
-        ]
-
-        if not coastline_ways:
-            raise Exception("No coastline found near this point.")
-
-        nearest_line = [
-            [nodes[node_id][1], nodes[node_id][0]]
-            for node_id in coastline_ways[0]["nodes"]
-            if node_id in nodes
-        ]
-
-        # Find the nearest segment
-        min_dist = float("inf")
-        nearest_segment = None
-        for i in range(len(nearest_line) - 1):
-            segment = nearest_line[i : i + 2]
-            dist = point_line_distance(beach_lat, beach_lon, segment)
-            if dist < min_dist:
-                min_dist = dist
-                nearest_segment = segment
-
-        if nearest_segment is None:
-            raise Exception("No shoreline segment found near this point.")
-
-        point1 = nearest_segment[0]
-        point2 = interpolate_along_line(nearest_segment, 50)
-
-        lat1, lon1 = point1[1], point1[0]
-        lat2, lon2 = point2[1], point2[0]
-
-        # Get elevation
+        return measure_beach_profile(
+            beach_lat, beach_lon, fallback_slope, fallback_depth, coastline, bathymetry
+        )
+    except Exception as e:
+        logging.error("Error determining coastal geometry: %s", e)
+        return fallback_depth, fallback_slope, fallback_orientation
+
+
+def measure_beach_profile(
+    beach_lat,
+    beach_lon,
+    fallback_slope,
+    fallback_depth,
+    coastline=None,
+    bathymetry=None,
+):
+    """
+    Depth, slope and orientation of the beach from the nearest coastline and
+    ETOPO1 elevations. The coastline and elevations come from the offline
+    index and grid when given, otherwise from Overpass and opentopodata.
+    Raises when the coastline can't be determined.
+    """
+    if coastline is not None:
+        nearest_segment = coastline.nearest_segment(beach_lat, beach_lon)
+    else:
+        nearest_segment = fetch_nearest_coastline_segment(beach_lat, beach_lon)
+
+    if nearest_segment is None:
+        raise Exception("No shoreline segment found near this point.")
+
+    lat1, lon1, lat2, lon2 = profile_points(nearest_segment)
+
+    # Get elevation
+    if bathymetry is not None:
+        elev1, elev2 = bathymetry.elevations_at([lat1, lat2], [lon1, lon2]).tolist()
+        if math.isnan(elev1) or math.isnan(elev2):
+            raise Exception("Point is outside the bathymetry grid.")
+    else:
         elev1, elev2 = get_elevations_etopo1([(lat1, lon1), (lat2, lon2)])
 
-        # Calculate slope and orientation
-        distance, slope, _ = calculate_slope_and_angle(
-            lat1, lon1, lat2, lon2, elev1, elev2
-        )
-        orientation = (calculate_orientation(lat1, lon1, lat2, lon2) + 90) % 360
-
-        # Adjust slope and depth
-        if slope < 0.01:
-            slope = fallback_slope
-        depth = -elev2 if elev2 < 0 else fallback_depth
-
-        logging.info("Point 1 (onshore): %s, %s, Elevation: %.2f m", lat1, lon1, elev1)
-        logging.info("Point 2 (offshore): %s, %s, Elevation: %.2f m", lat2, lon2, elev2)
-        logging.info(
-            "Distance: %.2f m, Slope: %.4f, Orientation: %.2f°, Depth: %.2f m",
-            distance,
-            slope,
-            orientation,
-            depth,
+    return profile_from_elevations(
+        lat1, lon1, lat2, lon2, elev1, elev2, fallback_slope, fallback_depth
+    )
+
+
+def measure_beach_profiles(
+    beaches, fallback_slope, fallback_depth, coastline, bathymetry
+):
+    """
+    Offline measure_beach_profile for a batch of (lat, lon) beaches, looking up
+    the elevations of every beach in a single bathymetry call. Beaches that
+    can't be measured get None.
+    """
+    points = []
+    for beach_lat, beach_lon in beaches:
+        segment = coastline.nearest_segment(beach_lat, beach_lon)
+        points.append(profile_points(segment) if segment is not None else None)
+
+    measured = [p for p in points if p is not None]
+    elevations = bathymetry.elevations_at(
+        [lat for p in measured for lat in (p[0], p[2])],
+        [lon for p in measured for lon in (p[1], p[3])],
+    ).tolist()
+
+    results = []
+    elevation_index = 0
+    for point in points:
+        if point is None:
+            results.append(None)
+            continue
+
+        elev1, elev2 = elevations[elevation_index : elevation_index + 2]
+        elevation_index += 2
+        if math.isnan(elev1) or math.isnan(elev2):
+            results.append(None)
+            continue
+
+        results.append(
+            profile_from_elevations(
+                *point, elev1, elev2, fallback_slope, fallback_depth
+            )
         )
 
-        return depth, slope, orientation
+    return results
 
-    except Exception as e:
-        logging.error("Error determining coastal geometry: %s", e)
-        return fallback_depth, fallback_slope, fallback_orientation
+
+def profile_points(nearest_segment):
+    """Onshore and offshore (lat1, lon1, lat2, lon2) along the coastline segment."""
+    point1 = nearest_segment[0]
+    point2 = interpolate_along_line(nearest_segment, 50)
+
+    return point1[1], point1[0], point2[1], point2[0]
+
+
+def profile_from_elevations(
+    lat1, lon1, lat2, lon2, elev1, elev2, fallback_slope, fallback_depth
+):
+    # Calculate slope and orientation
+    distance, slope, _ = calculate_slope_and_angle(lat1, lon1, lat2, lon2, elev1, elev2)
+    orientation = (calculate_orientation(lat1, lon1, lat2, lon2) + 90) % 360
+
+    # Adjust slope and depth
+    if slope < 0.01:
+        slope = fallback_slope
+    depth = -elev2 if elev2 < 0 else fallback_depth
+
+    logging.info("Point 1 (onshore): %s, %s, Elevation: %.2f m", lat1, lon1, elev1)
+    logging.info("Point 2 (offshore): %s, %s, Elevation: %.2f m", lat2, lon2, elev2)
+    logging.info(
+        "Distance: %.2f m, Slope: %.4f, Orientation: %.2f°, Depth: %.2f m",
+        distance,
+        slope,
+        orientation,
+        depth,
+    )
+
+    return depth, slope, orientation
+
+
+def fetch_nearest_coastline_segment(beach_lat, beach_lon):
+    # Overpass API query to find nearest coastline
+    overpass_url = "https://overpass-api.de/api/interpreter"
+    query = f"""
+    [out:json];
+    (
+      way(around:500,{beach_lat},{beach_lon})["natural"="coastline"];
+    );
+    out body;
+    >;
+    out skel qt;
+    """
+
+    response = requests.post(overpass_url, data=query)
+    response.raise_for_status()
+    osm_data = response.json()
+
+    # Extract nodes and coastline ways
+    nodes = {
+        elem["id"]: (elem["lat"], elem["lon"])
+        for elem in osm_data.get("elements", [])
+        if elem["type"] == "node"
+    }
+    coastline_ways = [
+        elem for elem in osm_data.get("elements", []) if elem["type"] == "way"
+    ]
+
+    if not coastline_ways:
+        raise Exception("No coastline found near this point.")
+
+    nearest_line = [
+        [nodes[node_id][1], nodes[node_id][0]]
+        for node_id in coastline_ways[0]["nodes"]
+        if node_id in nodes
+    ]
+
+    # Find the nearest segment
+    min_dist = float("inf")
+    nearest_segment = None
+    for i in range(len(nearest_line) - 1):
+        segment = nearest_line[i : i + 2]
+        dist = point_line_distance(beach_lat, beach_lon, segment)
+        if dist < min_dist:
+            min_dist = dist
+            nearest_segment = segment
+
+    return nearest_segment
 
 
 def haversine(lat1, lon1, lat2, lon2):
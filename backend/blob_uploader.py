@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from mypy_boto3_s3.service_resource import Bucket
+
+
+class BlobUploader:
+    """
+    Runs S3 requests on a dedicated thread pool sized to the upload
+    concurrency, so uploads neither block the event loop nor queue behind
+    other work in the default executor. Retries are left to botocore, which
+    the bucket's client is configured for.
+    """
+
+    def __init__(self, bucket: Bucket, workers: int):
+        self.bucket = bucket
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="s3-upload"
+        )
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.first_started: float | None = None
+        self.last_finished: float | None = None
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def put(self, key: str, body: bytes, **kwargs) -> None:
+        started = time.monotonic()
+        if self.first_started is None:
+            self.first_started = started
+
+        await self._run(self.bucket.put_object, Key=key, Body=body, **kwargs)
+
+        self.uploads += 1
+        self.uploaded_bytes += len(body)
+        self.last_finished = time.monotonic()
+        logging.debug(
+            "Uploaded %s (%d bytes) in %.2fs",
+            key,
+            len(body),
+            time.monotonic() - started,
+        )
+
+    async def get_metadata(self, key: str) -> dict[str, str] | None:
+        """User metadata of the uploaded blob, None when it doesn't exist."""
+
+        def head() -> dict[str, str] | None:
+            try:
+                return self.bucket.Object(key).metadata
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code in ("404", "NoSuchKey", "NotFound"):
+                    return None
+                raise
+
+        return await self._run(head)
+
+    def log_throughput(self) -> None:
+        if not self.uploads or self.first_started is None or not self.last_finished:
+            return
+
+        elapsed = max(self.last_finished - self.first_started, 1e-6)
+        logging.info(
+            "Uploaded %d blobs, %.1f MB in %.1fs (%.1f blobs/s, %.2f MB/s)",
+            self.uploads,
+            self.uploaded_bytes / 1e6,
+            elapsed,
+            self.uploads / elapsed,
+            self.uploaded_bytes / 1e6 / elapsed,
+        )
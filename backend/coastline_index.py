@@ -0,0 +1,182 @@
+import json
+import math
+import sys
+
+import numpy as np
+
+EARTH_RADIUS = 6371000  # meters
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+# Size in degrees of the grid buckets segments are indexed by
+CELL_SIZE = 0.05
+CELL_COLUMNS = int(360 / CELL_SIZE)
+
+
+class CoastlineIndex:
+    """
+    Offline coastline segments bucketed on a regular lat/lon grid. Segments
+    are (lon1, lat1, lon2, lat2) in the direction of the source way, which
+    for OSM coastlines keeps the water on the right.
+    """
+
+    def __init__(self, segments: np.ndarray):
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        keys = cell_keys(
+            (segments[:, 1] + segments[:, 3]) / 2,
+            (segments[:, 0] + segments[:, 2]) / 2,
+        )
+        order = np.argsort(keys, kind="stable")
+        self.segments = segments[order]
+        self.cell_ids, self.cell_starts, counts = np.unique(
+            keys[order], return_index=True, return_counts=True
+        )
+        self.cell_ends = self.cell_starts + counts
+
+        # A segment can reach this far from the cell its midpoint falls into
+        extents = np.maximum(
+            np.abs(segments[:, 2] - segments[:, 0]),
+            np.abs(segments[:, 3] - segments[:, 1]),
+        )
+        self.max_half_extent = float(extents.max() / 2) if len(extents) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    @staticmethod
+    def load(path: str) -> "CoastlineIndex":
+        """Load segments from a GeoJSON coastline extract or a saved .npz index."""
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                return CoastlineIndex(data["segments"])
+
+        with open(path) as fp:
+            return CoastlineIndex(segments_from_geojson(json.load(fp)))
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, segments=self.segments)
+
+    def candidates(self, lat: float, lon: float, radius_m: float) -> np.ndarray:
+        """Indices of the segments that may lie within radius_m of the point."""
+        lat_radius = radius_m / METERS_PER_DEGREE + self.max_half_extent
+        lon_radius = (
+            radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+            + self.max_half_extent
+        )
+
+        rows = np.arange(
+            cell_row(lat - lat_radius), cell_row(lat + lat_radius) + 1, dtype=np.int64
+        )
+        columns = np.arange(
+            cell_column(lon - lon_radius),
+            cell_column(lon + lon_radius) + 1,
+            dtype=np.int64,
+        )
+        keys = (rows[:, None] * CELL_COLUMNS + columns[None, :]).ravel()
+
+        positions = np.searchsorted(self.cell_ids, keys)
+        found = positions < len(self.cell_ids)
+        positions, keys = positions[found], keys[found]
+        positions = positions[self.cell_ids[positions] == keys]
+        if not len(positions):
+            return np.empty(0, dtype=np.int64)
+
+        return np.concatenate(
+            [
+                np.arange(self.cell_starts[p], self.cell_ends[p])
+                for p in positions.tolist()
+            ]
+        )
+
+    def nearest_segment(
+        self, lat: float, lon: float, radius_m: float = 500
+    ) -> list[list[float]] | None:
+        """
+        Nearest coastline segment within radius_m of the point as
+        [[lon1, lat1], [lon2, lat2]], or None when there is none.
+        """
+        candidates = self.candidates(lat, lon, radius_m)
+        if not len(candidates):
+            return None
+
+        distances = point_segment_distances(lat, lon, self.segments[candidates])
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > radius_m:
+            return None
+
+        lon1, lat1, lon2, lat2 = self.segments[candidates[nearest]].tolist()
+        return [[lon1, lat1], [lon2, lat2]]
+
+
+def cell_row(lat):
+    return np.floor((np.asarray(lat) + 90) / CELL_SIZE).astype(np.int64)
+
+
+def cell_column(lon):
+    return np.floor((np.asarray(lon) + 180) / CELL_SIZE).astype(np.int64)
+
+
+def cell_keys(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    return cell_row(lats) * CELL_COLUMNS + cell_column(lons)
+
+
+def point_segment_distances(lat: float, lon: float, segments: np.ndarray) -> np.ndarray:
+    """
+    Distance in meters from the point to each segment, on a local
+    equirectangular projection around the point.
+    """
+    x_scale = METERS_PER_DEGREE * math.cos(math.radians(lat))
+    x1 = (segments[:, 0] - lon) * x_scale
+    y1 = (segments[:, 1] - lat) * METERS_PER_DEGREE
+    x2 = (segments[:, 2] - lon) * x_scale
+    y2 = (segments[:, 3] - lat) * METERS_PER_DEGREE
+
+    dx = x2 - x1
+    dy = y2 - y1
+    length_squared = dx * dx + dy * dy
+
+    # Position of the closest point along each segment, clamped to its ends
+    t = np.divide(
+        -(x1 * dx + y1 * dy),
+        length_squared,
+        out=np.zeros_like(length_squared),
+        where=length_squared > 0,
+    )
+    t = np.clip(t, 0, 1)
+    return np.hypot(x1 + t * dx, y1 + t * dy)
+
+
+def segments_from_geojson(data: dict) -> np.ndarray:
+    lines = []
+    features = data.get("features", [data])
+    for feature in features:
+        geometry = feature.get("geometry", feature)
+        kind = geometry.get("type")
+        coordinates = geometry.get("coordinates", [])
+
+        if kind == "LineString":
+            lines.append(coordinates)
+        elif kind in ("MultiLineString", "Polygon"):
+            lines.extend(coordinates)
+        elif kind == "MultiPolygon":
+            for polygon in coordinates:
+                lines.extend(polygon)
+
+    segments = []
+    for line in lines:
+        if len(line) < 2:
+            continue
+
+        points = np.asarray(line, dtype=np.float64)[:, :2]
+        segments.append(np.hstack((points[:-1], points[1:])))
+
+    return np.vstack(segments) if segments else np.empty((0, 4))
+
+
+if __name__ == "__main__":
+    # Convert a GeoJSON coastline extract into a compact index file
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m coastline_index INPUT.geojson OUTPUT.npz")
+
+    index = CoastlineIndex.load(sys.argv[1])
+    index.save(sys.argv[2])
+    print(f"Saved {len(index)} coastline segments to {sys.argv[2]}")
@@ -3,35 +3,204 @@ from urllib.parse import urlparse
 
 
 import boto3
+from botocore.config import Config as BotoConfig
 from mypy_boto3_s3.service_resource import Bucket
 
+from forecast_encoding import FORECAST_FORMAT_ROWS, FORECAST_FORMATS
+
+# Ways of starting a refresh: a fixed cron schedule, or as the forecast hours
+# of a new wave model cycle are published
+REFRESH_TRIGGER_SCHEDULE = "schedule"
+REFRESH_TRIGGER_MODEL_CYCLE = "model_cycle"
+REFRESH_TRIGGERS = (REFRESH_TRIGGER_SCHEDULE, REFRESH_TRIGGER_MODEL_CYCLE)
+
+
+def get_int_setting(name: str, default: int, minimum: int = 1) -> int:
+    value = os.environ.get(name)
+    if not value:
+        return default
+
+    try:
+        result = int(value)
+    except ValueError:
+        raise ValueError(f"{name.lower()} configuration must be an integer")
+
+    if result < minimum:
+        raise ValueError(f"{name.lower()} configuration must be at least {minimum}")
+
+    return result
+
+
+def get_bool_setting(name: str) -> bool:
+    return os.environ.get(name) in ("1", "True", "true")
+
 
 class Config:
-    def __init__(self, is_development: bool, schedule: str, s3_bucket: Bucket):
+    def __init__(
+        self,
+        is_development: bool,
+        schedule: str | None,
+        s3_bucket: Bucket,
+        fetch_concurrency: int = 4,
+        compute_concurrency: int = 1,
+        upload_concurrency: int = 4,
+        pipeline_queue_size: int = 8,
+        grib_cache_dir: str | None = None,
+        process_pool_workers: int = 0,
+        selective_grib_downloads: bool = False,
+        cache_memory_mb: int = 0,
+        morphology_store_path: str | None = None,
+        coastline_path: str | None = None,
+        bathymetry_path: str | None = None,
+        tide_store_dir: str | None = None,
+        tide_harmonics_path: str | None = None,
+        station_catalog_path: str | None = None,
+        station_catalog_ttl_hours: int = 24,
+        http_session_ttl_minutes: int = 60,
+        forecast_format_version: int = FORECAST_FORMAT_ROWS,
+        compress_forecasts: bool = False,
+        publish_index_path: str | None = None,
+        s3_max_attempts: int = 5,
+        refresh_trigger: str = REFRESH_TRIGGER_SCHEDULE,
+        model_cycle_poll_minutes: int = 10,
+        model_cycle_state_path: str | None = None,
+    ):
         self.is_development = is_development
         self.schedule = schedule
         self.s3_bucket = s3_bucket
+        # number of locations in each refresh pipeline stage at once
+        self.fetch_concurrency = fetch_concurrency
+        self.compute_concurrency = compute_concurrency
+        self.upload_concurrency = upload_concurrency
+        # locations allowed to wait between two pipeline stages
+        self.pipeline_queue_size = pipeline_queue_size
+        # directory for downloaded GRIB files, disabled when not set
+        self.grib_cache_dir = grib_cache_dir
+        # worker processes for GRIB decoding and forecast computation,
+        # 0 keeps that work on the event loop
+        self.process_pool_workers = process_pool_workers
+        # fetch only the required GRIB messages with HTTP range requests
+        self.selective_grib_downloads = selective_grib_downloads
+        # memory budget for parsed GRIB data held during a refresh, 0 is unbounded
+        self.cache_memory_mb = cache_memory_mb
+        # file keeping measured beach morphology, measured every refresh when not set
+        self.morphology_store_path = morphology_store_path
+        # offline coastline extract (GeoJSON or .npz index), Overpass when not set
+        self.coastline_path = coastline_path
+        # memory-mapped elevation grid (.npy with .json extent), opentopodata when not set
+        self.bathymetry_path = bathymetry_path
+        # directory for stored tide predictions, full window fetched when not set
+        self.tide_store_dir = tide_store_dir
+        # harmonic constants for predicting tides locally, NOAA is queried when not set
+        self.tide_harmonics_path = tide_harmonics_path
+        # snapshot of the NOAA station lists, downloaded on every start when not set
+        self.station_catalog_path = station_catalog_path
+        # how long station lists and HTTP connections are reused before renewal
+        self.station_catalog_ttl_hours = station_catalog_ttl_hours
+        self.http_session_ttl_minutes = http_session_ttl_minutes
+        # forecast blob layout, 1 for hourly rows and 2 for columns
+        self.forecast_format_version = forecast_format_version
+        # upload forecast blobs gzipped with a matching Content-Encoding
+        self.compress_forecasts = compress_forecasts
+        # file recording what was uploaded, every blob is uploaded when not set
+        self.publish_index_path = publish_index_path
+        # attempts per S3 request including retries of transient failures
+        self.s3_max_attempts = s3_max_attempts
+        # refresh on the cron schedule, or as new wave model hours are published
+        self.refresh_trigger = refresh_trigger
+        # how often wave model servers are probed for new forecast hours
+        self.model_cycle_poll_minutes = model_cycle_poll_minutes
+        # file recording the hours refreshed of each model's latest cycle
+        self.model_cycle_state_path = model_cycle_state_path
 
     @staticmethod
     def from_environment():
-        is_development = os.environ.get("IS_DEVELOPMENT") in ("1", "True", "true")
+        is_development = get_bool_setting("IS_DEVELOPMENT")
         schedule = os.environ.get("SCHEDULE")
         s3_service_url = os.environ.get("S3_SERVICE_URL")
         s3_bucket_name = os.environ.get("S3_BUCKET_NAME")
         s3_access_key_id = os.environ.get("S3_ACCESS_KEY_ID")
         s3_secret_key = os.environ.get("S3_SECRET_KEY")
+        fetch_concurrency = get_int_setting("FETCH_CONCURRENCY", 4)
+        compute_concurrency = get_int_setting("COMPUTE_CONCURRENCY", 1)
+        upload_concurrency = get_int_setting("UPLOAD_CONCURRENCY", 4)
+        pipeline_queue_size = get_int_setting("PIPELINE_QUEUE_SIZE", 8)
+        grib_cache_dir = os.environ.get("GRIB_CACHE_DIR") or None
+        process_pool_workers = get_int_setting("PROCESS_POOL_WORKERS", 0, minimum=0)
+        selective_grib_downloads = get_bool_setting("SELECTIVE_GRIB_DOWNLOADS")
+        cache_memory_mb = get_int_setting("CACHE_MEMORY_MB", 0, minimum=0)
+        morphology_store_path = os.environ.get("MORPHOLOGY_STORE_PATH") or None
+        coastline_path = os.environ.get("COASTLINE_PATH") or None
+        bathymetry_path = os.environ.get("BATHYMETRY_PATH") or None
+        tide_store_dir = os.environ.get("TIDE_STORE_DIR") or None
+        tide_harmonics_path = os.environ.get("TIDE_HARMONICS_PATH") or None
+        station_catalog_path = os.environ.get("STATION_CATALOG_PATH") or None
+        station_catalog_ttl_hours = get_int_setting("STATION_CATALOG_TTL_HOURS", 24)
+        http_session_ttl_minutes = get_int_setting("HTTP_SESSION_TTL_MINUTES", 60)
+        forecast_format_version = get_int_setting(
+            "FORECAST_FORMAT_VERSION", FORECAST_FORMAT_ROWS
+        )
+        if forecast_format_version not in FORECAST_FORMATS:
+            raise ValueError(
+                "forecast_format_version configuration must be one of "
+                + ", ".join(str(f) for f in FORECAST_FORMATS)
+            )
+        compress_forecasts = get_bool_setting("COMPRESS_FORECASTS")
+        publish_index_path = os.environ.get("PUBLISH_INDEX_PATH") or None
+        s3_max_attempts = get_int_setting("S3_MAX_ATTEMPTS", 5)
+        refresh_trigger = os.environ.get("REFRESH_TRIGGER") or REFRESH_TRIGGER_SCHEDULE
+        model_cycle_poll_minutes = get_int_setting("MODEL_CYCLE_POLL_MINUTES", 10)
+        model_cycle_state_path = os.environ.get("MODEL_CYCLE_STATE_PATH") or None
 
         Config.validate(
-            schedule, s3_service_url, s3_bucket_name, s3_access_key_id, s3_secret_key
+            schedule,
+            s3_service_url,
+            s3_bucket_name,
+            s3_access_key_id,
+            s3_secret_key,
+            refresh_trigger,
+            grib_cache_dir,
         )
         s3_bucket = boto3.resource(
             "s3",
             endpoint_url=s3_service_url,
             aws_access_key_id=s3_access_key_id,
             aws_secret_access_key=s3_secret_key,
+            config=BotoConfig(
+                # a connection for every upload worker plus metadata lookups
+                max_pool_connections=upload_concurrency + 2,
+                retries={"max_attempts": s3_max_attempts, "mode": "standard"},
+            ),
         ).Bucket(s3_bucket_name)
 
-        return Config(is_development, schedule, s3_bucket)
+        return Config(
+            is_development,
+            schedule,
+            s3_bucket,
+            fetch_concurrency=fetch_concurrency,
+            compute_concurrency=compute_concurrency,
+            upload_concurrency=upload_concurrency,
+            pipeline_queue_size=pipeline_queue_size,
+            grib_cache_dir=grib_cache_dir,
+            process_pool_workers=process_pool_workers,
+            selective_grib_downloads=selective_grib_downloads,
+            cache_memory_mb=cache_memory_mb,
+            morphology_store_path=morphology_store_path,
+            coastline_path=coastline_path,
+            bathymetry_path=bathymetry_path,
+            tide_store_dir=tide_store_dir,
+            tide_harmonics_path=tide_harmonics_path,
+            station_catalog_path=station_catalog_path,
+            station_catalog_ttl_hours=station_catalog_ttl_hours,
+            http_session_ttl_minutes=http_session_ttl_minutes,
+            forecast_format_version=forecast_format_version,
+            compress_forecasts=compress_forecasts,
+            publish_index_path=publish_index_path,
+            s3_max_attempts=s3_max_attempts,
+            refresh_trigger=refresh_trigger,
+            model_cycle_poll_minutes=model_cycle_poll_minutes,
+            model_cycle_state_path=model_cycle_state_path,
+        )
 
     @staticmethod
     def validate(
@@ -40,10 +209,25 @@ class Config:
         s3_bucket_name: str | None,
         s3_access_key_id: str | None,
         s3_secret_key: str | None,
+        refresh_trigger: str = REFRESH_TRIGGER_SCHEDULE,
+        grib_cache_dir: str | None = None,
     ):
-        if not schedule:
+        if refresh_trigger not in REFRESH_TRIGGERS:
+            raise ValueError(
+                "refresh_trigger configuration must be one of "
+                + ", ".join(REFRESH_TRIGGERS)
+            )
+
+        if refresh_trigger == REFRESH_TRIGGER_SCHEDULE and not schedule:
             raise ValueError("schedule configuration is required")
 
+        # Every pass over a cycle fetches all hours published so far, the GRIB
+        # cache keeps earlier hours from being downloaded again
+        if refresh_trigger == REFRESH_TRIGGER_MODEL_CYCLE and not grib_cache_dir:
+            raise ValueError(
+                "grib_cache_dir configuration is required by the model_cycle refresh trigger"
+            )
+
         if not s3_service_url:
             raise ValueError("s3_service_url configuration is required")
 
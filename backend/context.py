@@ -1,10 +1,29 @@
+import asyncio
+import copy
 import json
 import logging
-from typing import Awaitable, Callable, Hashable, Self, TypeVar, TypedDict
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Hashable, Self, TypeVar, TypedDict, cast
 
 import aiohttp
 import surfpy
 
+from bathymetry_grid import BathymetryGrid
+from blob_uploader import BlobUploader
+from coastline_index import CoastlineIndex
+from grib_parser import LocationGrid
+from grib_store import GribStore
+from memory_cache import MemoryBoundedCache
+from morphology_store import MorphologyStore
+from publish_index import PublishIndex
+from station_catalog import StationCatalog
+from station_index import StationIndex
+from tide_harmonics import TideHarmonics
+from tide_store import TideStore
+
 
 class KnownLocation(TypedDict):
     name: str
@@ -31,40 +50,267 @@ async def on_request_end(_1, _2, params: aiohttp.TraceRequestEndParams):
 trace_config = aiohttp.TraceConfig()
 trace_config.on_request_end.append(on_request_end)
 
+KNOWN_LOCATIONS_PATH = "known_locations.json"
+
+# Seconds between checks for expired resources
+MAINTENANCE_INTERVAL = 60
+# Seconds before retrying a failed station catalogue download
+CATALOG_RETRY_DELAY = 900
+
 
 TArg = TypeVar("TArg", bound=Hashable)
 TResult = TypeVar("TResult")
 
+_MISSING = object()
+
 
 class ForecastContext:
-    def __init__(self):
-        self.cache = {}
+    def __init__(
+        self,
+        grib_store: GribStore | None = None,
+        process_pool_workers: int = 0,
+        selective_grib_downloads: bool = False,
+        cache_budget_bytes: int = 0,
+        morphology_store: MorphologyStore | None = None,
+        coastline_index: CoastlineIndex | None = None,
+        bathymetry_grid: BathymetryGrid | None = None,
+        tide_store: TideStore | None = None,
+        tide_harmonics: TideHarmonics | None = None,
+        publish_index: PublishIndex | None = None,
+        uploader: BlobUploader | None = None,
+        station_catalog_path: str | None = None,
+        station_catalog_ttl: float = 24 * 3600,
+        http_session_ttl: float = 3600,
+    ):
+        # parsed GRIB windows and tide predictions shared by all locations of
+        # a refresh, evicted least recently used first over budget
+        self.cache = MemoryBoundedCache(cache_budget_bytes)
+        self.in_flight: dict[Hashable, asyncio.Task] = {}
+        # requests served by joining a computation already in flight
+        self.coalesced = 0
+        # only download the required GRIB messages, located via .idx inventories
+        self.selective_grib_downloads = selective_grib_downloads
+        # CPU-bound work runs on the event loop when no workers are configured
+        self.process_pool_workers = process_pool_workers
+        self.process_pool: ProcessPoolExecutor | None = None
+        # downloaded GRIB files persisted across refreshes and restarts
+        self.grib_store = grib_store
+        # measured beach depth, slope and orientation kept across refreshes
+        self.morphology_store = morphology_store
+        # local coastline used instead of Overpass queries when available
+        self.coastline_index = coastline_index
+        # local elevation grid used instead of opentopodata when available
+        self.bathymetry_grid = bathymetry_grid
+        # tide predictions kept across refreshes, only new days are fetched
+        self.tide_store = tide_store
+        # stations whose tides are predicted locally instead of fetched
+        self.tide_harmonics = tide_harmonics
+        # hashes of the uploaded blobs, unchanged blobs are not uploaded again
+        self.publish_index = publish_index
+        # uploads published blobs on its own thread pool
+        self.uploader = uploader
+        # forecast locations of each wave model, for batched grid extraction
+        self.location_grids: dict[surfpy.WaveModel, LocationGrid] = {}
+        # GRIB files of each model published so far of the probed cycle, other
+        # models use every file of their current cycle
+        self.forecast_urls: dict[surfpy.WaveModel, list[str]] = {}
+        # GRIB files requested for each model, their windows are released with it
+        self.wave_model_urls: dict[surfpy.WaveModel, set[str]] = {}
         self.buoy_stations = surfpy.BuoyStations()
         self.tide_stations = surfpy.TideStations()
+        # nearest-neighbour and ID lookups over the tide station catalogue
+        self.tide_station_index: StationIndex[surfpy.TideStation] = StationIndex([])
         self.known_surf_locations: dict[str, list[KnownLocation]] = {}
 
+        # The context lives as long as the process, resources below are
+        # renewed in the background once they expire
+        self.station_catalog: StationCatalog | None = None
+        # station lists snapshot read on startup instead of downloading them
+        self.station_catalog_path = station_catalog_path
+        self.station_catalog_ttl = station_catalog_ttl
+        self.next_catalog_attempt = 0.0
+        self.http_session_ttl = http_session_ttl
+        self.http_session_created = 0.0
+        self.known_locations: dict[str, list[KnownLocation]] = {}
+        self.known_locations_mtime = 0.0
+        # held by a refresh and anything else using the HTTP session, resources
+        # are only swapped while nothing holds it
+        self.refresh_lock = asyncio.Lock()
+        self.maintenance_task: asyncio.Task | None = None
+
     async def __aenter__(self):
-        self.http_session = aiohttp.ClientSession(trace_configs=[trace_config])
-        self.http_session.headers["User-Agent"] = "waves-forecast/1.0.0"
+        self.http_session = self.create_http_session()
 
-        # open pre-estabilished list of known surfing locations
-        with open("known_locations.json") as fp:
-            self.known_surf_locations = json.load(fp)
+        if self.process_pool_workers > 0:
+            # spawn rather than fork, the event loop process already runs threads
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.process_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        self.load_known_locations()
+
+        # NOAA station data for wave heights and tides (data comes from seperate
+        # stations), from the snapshot when there is one to avoid blocking on NOAA
+        catalog = None
+        if self.station_catalog_path:
+            catalog = await asyncio.to_thread(
+                StationCatalog.load, self.station_catalog_path
+            )
+        if catalog is None:
+            catalog = await asyncio.to_thread(StationCatalog.fetch)
+            await self.save_station_catalog(catalog)
+        self.apply_station_catalog(catalog)
 
-        # fetch NOAA station data for wave heights and tides (data comes from seperate stations)
-        self.buoy_stations.fetch_stations()
-        self.tide_stations.fetch_stations()
+        self.maintenance_task = asyncio.ensure_future(self.maintain())
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.maintenance_task:
+            self.maintenance_task.cancel()
+            await asyncio.gather(self.maintenance_task, return_exceptions=True)
+            self.maintenance_task = None
+
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+
+        if self.uploader:
+            await asyncio.to_thread(self.uploader.close)
+
         await self.http_session.__aexit__(exc_type, exc_val, exc_tb)
 
+    def create_http_session(self) -> aiohttp.ClientSession:
+        session = aiohttp.ClientSession(trace_configs=[trace_config])
+        session.headers["User-Agent"] = "waves-forecast/1.0.0"
+        self.http_session_created = time.monotonic()
+        return session
+
+    def load_known_locations(self) -> None:
+        # open pre-estabilished list of known surfing locations
+        mtime = os.path.getmtime(KNOWN_LOCATIONS_PATH)
+        with open(KNOWN_LOCATIONS_PATH) as fp:
+            self.known_locations = json.load(fp)
+        self.known_locations_mtime = mtime
+
+    def apply_station_catalog(self, catalog: StationCatalog) -> None:
+        self.station_catalog = catalog
+        self.buoy_stations = catalog.buoy_stations
+        self.tide_stations = catalog.tide_stations
+        self.tide_station_index = catalog.tide_station_index
+
+    async def save_station_catalog(self, catalog: StationCatalog) -> None:
+        if not self.station_catalog_path:
+            return
+
+        try:
+            await asyncio.to_thread(catalog.save, self.station_catalog_path)
+        except Exception:
+            logging.exception("Failed to save station catalog snapshot")
+
+    def begin_refresh(
+        self, forecast_urls: dict[surfpy.WaveModel, list[str]] | None = None
+    ) -> None:
+        """Reset the state that only lives for a single refresh."""
+        self.cache = MemoryBoundedCache(self.cache.budget_bytes, self.cache.sizeof)
+        self.coalesced = 0
+        self.location_grids = {}
+        self.forecast_urls = forecast_urls or {}
+        self.wave_model_urls = {}
+        # matching buoys to beaches annotates the locations, start from a clean copy
+        self.known_surf_locations = copy.deepcopy(self.known_locations)
+
+    def end_refresh(self) -> None:
+        """Release the refresh's data so it isn't held until the next one."""
+        self.cache.clear()
+        self.location_grids = {}
+        self.forecast_urls = {}
+        self.wave_model_urls = {}
+        self.known_surf_locations = {}
+
+    async def maintain(self) -> None:
+        while True:
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+            try:
+                await self.renew_expired_resources()
+            except Exception:
+                logging.exception("Failed to renew forecast context resources")
+
+    async def renew_expired_resources(self) -> None:
+        catalog = self.station_catalog
+        if (
+            catalog
+            and catalog.age() > self.station_catalog_ttl
+            and time.monotonic() >= self.next_catalog_attempt
+        ):
+            try:
+                catalog = await asyncio.to_thread(StationCatalog.fetch)
+            except Exception:
+                logging.exception("Failed to refresh station catalog, keeping old one")
+                self.next_catalog_attempt = time.monotonic() + CATALOG_RETRY_DELAY
+            else:
+                await self.save_station_catalog(catalog)
+                async with self.refresh_lock:
+                    self.apply_station_catalog(catalog)
+
+        if os.path.getmtime(KNOWN_LOCATIONS_PATH) != self.known_locations_mtime:
+            logging.info("Reloading known surf locations")
+            async with self.refresh_lock:
+                self.load_known_locations()
+
+        if time.monotonic() - self.http_session_created > self.http_session_ttl:
+            async with self.refresh_lock:
+                old_session = self.http_session
+                self.http_session = self.create_http_session()
+            await old_session.close()
+
+    async def run_cpu_bound(self, func: Callable[..., TResult], *args) -> TResult:
+        """
+        Run func in the process pool when one is configured so the event loop
+        keeps serving network I/O. Arguments and result must be picklable.
+        """
+        if not self.process_pool:
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.process_pool, func, *args)
+
     async def get_cached_or_compute(
         self,
         key: TArg,
         generate_func: Callable[[Self, TArg], Awaitable[TResult]],
     ) -> TResult:
-        if key not in self.cache:
-            self.cache[key] = await generate_func(self, key)
+        result = self.cache.get(key, _MISSING)
+        if result is not _MISSING:
+            return cast(TResult, result)
+
+        # Callers asking for a key that is still being computed share its task
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, generate_func))
+            self.in_flight[key] = task
+        else:
+            self.coalesced += 1
+
+        # A cancelled caller must not cancel the computation for the others
+        return await asyncio.shield(task)
+
+    async def _compute(
+        self,
+        key: TArg,
+        generate_func: Callable[[Self, TArg], Awaitable[TResult]],
+    ) -> TResult:
+        try:
+            result = await generate_func(self, key)
+            self.cache.put(key, result)
+            return result
+        finally:
+            # Exceptions reach every waiter but are not cached, the next call retries
+            self.in_flight.pop(key, None)
+
+    def get_location_grid(self, wave_model: surfpy.WaveModel) -> LocationGrid:
+        grid = self.location_grids.get(wave_model)
+        if grid is None:
+            grid = self.location_grids[wave_model] = LocationGrid()
 
-        return self.cache[key]
+        return grid
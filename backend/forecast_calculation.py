@@ -1,10 +1,155 @@
+import asyncio
+import logging
+
 import surfpy
-from metocean_data_retrieval import WaveForecastData, retrieve_new_data
-from beach_morphology import beach_profile_and_planform
+from metocean_data_retrieval import (
+    ForecastInputs,
+    WaveForecastData,
+    compute_forecast,
+    fetch_forecast_inputs,
+)
+from beach_morphology import (
+    beach_profile_and_planform,
+    measure_beach_profile,
+    measure_beach_profiles,
+)
 from context import ForecastContext
+from morphology_store import BeachMorphology
 
 
-async def get_wave_forecast(
+# Hours of wave model forecast retrieved for every location
+FORECAST_HOURS = 384
+
+# Fallback default values
+FALLBACK_DEPTH = 10.0
+FALLBACK_SLOPE = 0.02
+
+
+def get_fallback_orientation(beach_lon: float) -> float:
+    # use longitude to ensure semi accurate fallback orientation
+    if beach_lon > -81 and beach_lon < -66:
+        # beach is located on US East Coast - faces East
+        return 90.0
+    elif beach_lon > -126 and beach_lon < -117:
+        # beach is located on US West Coast - faces West
+        return 270.0
+
+    return 180.0  # facing south
+
+
+def fallback_morphology(beach_lon: float) -> BeachMorphology:
+    return {
+        "depth": FALLBACK_DEPTH,
+        "slope": FALLBACK_SLOPE,
+        "orientation": get_fallback_orientation(beach_lon),
+        "fallback": True,
+    }
+
+
+async def prepare_beach_morphology(
+    context: ForecastContext, beaches: list[tuple[float, float]]
+) -> None:
+    """
+    Measure every beach missing from the morphology store in one offline batch,
+    so the refresh itself only reads stored results. Beaches that can't be
+    measured store the fallback values.
+    """
+    store = context.morphology_store
+    if not store or not context.coastline_index or not context.bathymetry_grid:
+        return
+
+    missing = list({b for b in beaches if not store.get(*b)})
+    if not missing:
+        return
+
+    logging.info("Measuring beach morphology for %d beaches", len(missing))
+    results = await asyncio.to_thread(
+        measure_beach_profiles,
+        missing,
+        FALLBACK_SLOPE,
+        FALLBACK_DEPTH,
+        context.coastline_index,
+        context.bathymetry_grid,
+    )
+    await asyncio.to_thread(
+        store.put_many,
+        [
+            (
+                beach_lat,
+                beach_lon,
+                (
+                    {"depth": r[0], "slope": r[1], "orientation": r[2]}
+                    if r is not None
+                    else fallback_morphology(beach_lon)
+                ),
+            )
+            for (beach_lat, beach_lon), r in zip(missing, results)
+        ],
+    )
+
+
+async def get_beach_morphology(
+    context: ForecastContext,
+    beach_lat: float,
+    beach_lon: float,
+    fallback_slope: float,
+    fallback_depth: float,
+    fallback_orientation: float,
+) -> tuple[float, float, float]:
+    store = context.morphology_store
+    if not store:
+        return await asyncio.to_thread(
+            beach_profile_and_planform,
+            beach_lat,
+            beach_lon,
+            fallback_slope,
+            fallback_depth,
+            fallback_orientation,
+            context.coastline_index,
+            context.bathymetry_grid,
+        )
+
+    stored = store.get(beach_lat, beach_lon)
+    if stored:
+        return stored["depth"], stored["slope"], stored["orientation"]
+
+    # Failures store the fallback values too, so the beach isn't measured
+    # again on every refresh until its entry is invalidated
+    try:
+        depth, slope, orientation = await asyncio.to_thread(
+            measure_beach_profile,
+            beach_lat,
+            beach_lon,
+            fallback_slope,
+            fallback_depth,
+            context.coastline_index,
+            context.bathymetry_grid,
+        )
+    except Exception as e:
+        logging.error("Error determining coastal geometry: %s", e)
+        await asyncio.to_thread(
+            store.put,
+            beach_lat,
+            beach_lon,
+            {
+                "depth": fallback_depth,
+                "slope": fallback_slope,
+                "orientation": fallback_orientation,
+                "fallback": True,
+            },
+        )
+        return fallback_depth, fallback_slope, fallback_orientation
+
+    await asyncio.to_thread(
+        store.put,
+        beach_lat,
+        beach_lon,
+        {"depth": depth, "slope": slope, "orientation": orientation},
+    )
+    return depth, slope, orientation
+
+
+async def fetch_wave_forecast_inputs(
     context: ForecastContext,
     beach_name: str,
     wave_model: surfpy.WaveModel,
@@ -14,25 +159,17 @@ async def get_wave_forecast(
     beach_lat: float,
     beach_lon: float,
     jetty_obstructions: list[int],
-    hours_to_forecast=384,
-) -> WaveForecastData:
-
-    # Fallback default values
-    fallback_depth = 10.0
-    fallback_slope = 0.02
-    fallback_orientation = 180.0  # facing south
-
-    # use longitude to ensure semi accurate fallback orientation
-    if beach_lon > -81 and beach_lon < -66:
-        # beach is located on US East Coast - faces East
-        fallback_orientation = 90.0
-    elif beach_lon > -126 and beach_lon < -117:
-        # beach is located on US West Coast - faces West
-        fallback_orientation = 270.0
+    hours_to_forecast=FORECAST_HOURS,
+) -> ForecastInputs:
 
     # calculate beach characteristics for accurate forecast
-    depth, slope, orientation = beach_profile_and_planform(
-        beach_lat, beach_lon, fallback_slope, fallback_depth, fallback_orientation
+    depth, slope, orientation = await get_beach_morphology(
+        context,
+        beach_lat,
+        beach_lon,
+        FALLBACK_SLOPE,
+        FALLBACK_DEPTH,
+        get_fallback_orientation(beach_lon),
     )
 
     # Setup location
@@ -46,8 +183,8 @@ async def get_wave_forecast(
         slope=slope,
     )
 
-    # Retrieve forecast data
-    data = await retrieve_new_data(
+    # Retrieve model, weather and tide data
+    return await fetch_forecast_inputs(
         context,
         wave_model,
         hours_to_forecast,
@@ -56,4 +193,30 @@ async def get_wave_forecast(
         jetty_obstructions,
     )
 
-    return data
+
+async def get_wave_forecast(
+    context: ForecastContext,
+    beach_name: str,
+    wave_model: surfpy.WaveModel,
+    buoy_lat: float,
+    buoy_lon: float,
+    tide_stations: list[str] | None,
+    beach_lat: float,
+    beach_lon: float,
+    jetty_obstructions: list[int],
+    hours_to_forecast=FORECAST_HOURS,
+) -> WaveForecastData:
+    inputs = await fetch_wave_forecast_inputs(
+        context,
+        beach_name,
+        wave_model,
+        buoy_lat,
+        buoy_lon,
+        tide_stations,
+        beach_lat,
+        beach_lon,
+        jetty_obstructions,
+        hours_to_forecast,
+    )
+
+    return await context.run_cpu_bound(compute_forecast, inputs)
@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+import json
+
+# Forecast blob layouts. Rows is the original list of hourly dicts, columns
+# stores every series as one array (struct of arrays) under the same keys.
+FORECAST_FORMAT_ROWS = 1
+FORECAST_FORMAT_COLUMNS = 2
+FORECAST_FORMATS = (FORECAST_FORMAT_ROWS, FORECAST_FORMAT_COLUMNS)
+
+# Series stored as columns in the columnar layout
+COLUMNAR_SERIES = ("hourly_forecast", "tide_forecast")
+
+# Fields that change on every refresh without the content changing
+VOLATILE_FIELDS = ("generated_at",)
+
+
+class EncodedBody:
+    def __init__(
+        self, data: bytes, content_encoding: str | None, content_hash: str | None = None
+    ):
+        self.data = data
+        self.content_encoding = content_encoding
+        # identifies the published content, see content_hash()
+        self.content_hash = content_hash
+
+
+def content_hash(content: dict, *variant) -> str:
+    """
+    Stable hash of the content without its volatile fields. Variant values
+    (layout, compression) are hashed along, so changing them republishes.
+    """
+    stable = {k: v for k, v in content.items() if k not in VOLATILE_FIELDS}
+    canonical = json.dumps([stable, *variant], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def to_columns(rows: list[dict]) -> dict[str, list]:
+    """Turn a list of dicts into one list per key, None where a row lacks it."""
+    keys = dict.fromkeys(key for row in rows for key in row)
+    return {key: [row.get(key) for row in rows] for key in keys}
+
+
+def encode_forecast(
+    forecast: dict, format_version: int = FORECAST_FORMAT_ROWS, compress=False
+) -> EncodedBody:
+    """Serialize a forecast in the requested layout, gzipped when compress is set."""
+    forecast_hash = content_hash(forecast, format_version, compress)
+    if format_version == FORECAST_FORMAT_COLUMNS:
+        columnar = {**forecast, "format_version": FORECAST_FORMAT_COLUMNS}
+        for series in COLUMNAR_SERIES:
+            if series in columnar:
+                columnar[series] = to_columns(columnar[series])
+
+        data = json.dumps(columnar, separators=(",", ":")).encode()
+    else:
+        data = json.dumps(forecast).encode()
+
+    if not compress:
+        return EncodedBody(data, None, forecast_hash)
+
+    # mtime=0 keeps the output identical for identical forecasts
+    return EncodedBody(
+        gzip.compress(data, compresslevel=6, mtime=0), "gzip", forecast_hash
+    )
@@ -1,12 +1,32 @@
+import asyncio
 import json
 import logging
-from typing import TypedDict
+from typing import Collection, TypedDict, cast
+
+import surfpy
 
 import forecast_calculation
+from bathymetry_grid import BathymetryGrid
+from blob_uploader import BlobUploader
+from coastline_index import CoastlineIndex
 from config import Config
 from context import ForecastContext
-from locations import get_coastal_locations
-from wave_model import get_wave_model
+from forecast_encoding import EncodedBody, content_hash, encode_forecast
+from grib_store import GribStore
+from locations import LocationData, get_coastal_locations
+from metocean_data_retrieval import (
+    ForecastInputs,
+    WaveForecastData,
+    compute_forecast,
+    release_wave_model_data,
+)
+from model_cycles import ModelCycleState, probe_model_cycle
+from morphology_store import MorphologyStore
+from pipeline import PipelineStage, run_pipeline
+from publish_index import PublishIndex
+from tide_harmonics import TideHarmonics
+from tide_store import TideStore
+from wave_model import all_wave_models, fallback_model, get_wave_model
 
 data_container_name = "data"
 locations_blob_path = f"{data_container_name}/locations"
@@ -23,73 +43,361 @@ class LocationForecastRequest(TypedDict):
     jetty_obstructions: list[int]
 
 
-async def refresh_forecast(
-    config: Config, context: ForecastContext, location: LocationForecastRequest
-) -> None:
-    logging.info("Refreshing forecast for %s", location["name"])
-
-    # Determine NOAA wave model
-    wave_model = get_wave_model(location["buoy_latitude"], location["buoy_longitude"])
-    # Fetch wave forecast data
-    wave_forecast = await forecast_calculation.get_wave_forecast(
-        context=context,
-        beach_name=location["name"],
-        wave_model=wave_model,
-        buoy_lat=location["buoy_latitude"],
-        buoy_lon=location["buoy_longitude"],
-        tide_stations=location["tide_stations"],
-        beach_lat=location["beach_latitude"],
-        beach_lon=location["beach_longitude"],
-        jetty_obstructions=location["jetty_obstructions"],
-    )
+class ForecastJob:
+    def __init__(self, request: LocationForecastRequest, wave_model: surfpy.WaveModel):
+        self.request = request
+        self.wave_model = wave_model
+        # Each stage clears the previous stage's output once it is consumed
+        self.inputs: ForecastInputs | None = None
+        self.forecast: WaveForecastData | None = None
+        self.body: EncodedBody | None = None
+        # False when the forecast was unchanged and its upload skipped
+        self.published: bool | None = None
+        # wave model forecast hours the forecast was computed from
+        self.wave_hours = 0
 
-    # Handle missing forecast data
-    if not wave_forecast:
-        logging.error("Failed to retrieve forecast data for %s", location["name"])
-        return
+
+async def publish_blob(
+    context: ForecastContext,
+    key: str,
+    body: EncodedBody,
+    cache_control: str,
+) -> bool:
+    """Upload the blob unless the same content is already published."""
+    uploader = cast(BlobUploader, context.uploader)
+    index = context.publish_index
+    if index and body.content_hash:
+        if index.needs_reconcile(key):
+            # The bucket may have changed behind the index, check what it holds
+            metadata = await uploader.get_metadata(key)
+            index.reconcile(key, metadata.get("content-hash") if metadata else None)
+
+        if index.get(key) == body.content_hash:
+            logging.debug("Skipping upload of unchanged %s", key)
+            return False
+
+    extra_args = {}
+    if body.content_encoding:
+        extra_args["ContentEncoding"] = body.content_encoding
+    if body.content_hash:
+        extra_args["Metadata"] = {"content-hash": body.content_hash}
 
     # Upload to S3
-    config.s3_bucket.put_object(
-        Key=location["output_path"],
-        Body=json.dumps(wave_forecast),
+    await uploader.put(
+        key,
+        body.data,
         ContentType="application/json",
-        CacheControl="public, max-age=1800",
+        CacheControl=cache_control,
+        **extra_args,
     )
 
+    if index and body.content_hash:
+        index.put(key, body.content_hash)
+    return True
+
 
-async def refresh_api_data(config: Config):
-    async with ForecastContext() as context:
-        logging.info("Refreshing locations response blob")
+def resolve_forecast_jobs(
+    context: ForecastContext,
+    locations: list[LocationData],
+    wave_models: Collection[surfpy.WaveModel] | None = None,
+) -> list[ForecastJob]:
+    """Forecast jobs of the locations, only those on wave_models when given."""
+    jobs = []
+    for loc in locations:
+        # Determine NOAA wave model
+        wave_model = get_wave_model(loc["buoy_latitude"], loc["buoy_longitude"])
+        if wave_models is not None and wave_model not in wave_models:
+            continue
 
-        # Get updated locations and upload to S3
-        locations_data = get_coastal_locations(context)
-        config.s3_bucket.put_object(
-            Key=locations_blob_path,
-            Body=json.dumps({"locations": locations_data}),
-            ContentType="application/json",
-            CacheControl="public, max-age=7200",
+        # Register every location up front so each GRIB message is only
+        # reduced once for the whole model grid
+        context.get_location_grid(wave_model).add(
+            surfpy.Location(loc["buoy_latitude"], loc["buoy_longitude"])
         )
+        jobs.append(ForecastJob(create_forecast_request(loc), wave_model))
+
+    return jobs
+
+
+def group_by_wave_model(
+    jobs: list[ForecastJob],
+) -> dict[surfpy.WaveModel, list[ForecastJob]]:
+    """Jobs of each wave model, models in the order they first appear."""
+    groups: dict[surfpy.WaveModel, list[ForecastJob]] = {}
+    for job in jobs:
+        groups.setdefault(job.wave_model, []).append(job)
+
+    return groups
+
+
+def create_forecast_request(loc: LocationData) -> LocationForecastRequest:
+    return {
+        "output_path": f"{data_container_name}/forecast/{loc['id']}",
+        "buoy_latitude": loc["buoy_latitude"],
+        "buoy_longitude": loc["buoy_longitude"],
+        "name": loc["name"],
+        "tide_stations": loc["tide_stations"],
+        "beach_latitude": loc["beach_latitude"],
+        "beach_longitude": loc["beach_longitude"],
+        "jetty_obstructions": loc["jetty_obstructions"],
+    }
+
+
+def create_forecast_pipeline(
+    config: Config, context: ForecastContext
+) -> list[PipelineStage[ForecastJob]]:
+    async def fetch(job: ForecastJob) -> ForecastJob:
+        location = job.request
+        logging.info("Refreshing forecast for %s", location["name"])
+
+        job.inputs = await forecast_calculation.fetch_wave_forecast_inputs(
+            context=context,
+            beach_name=location["name"],
+            wave_model=job.wave_model,
+            buoy_lat=location["buoy_latitude"],
+            buoy_lon=location["buoy_longitude"],
+            tide_stations=location["tide_stations"],
+            beach_lat=location["beach_latitude"],
+            beach_lon=location["beach_longitude"],
+            jetty_obstructions=location["jetty_obstructions"],
+        )
+        job.wave_hours = len(job.inputs["wave_data"].get("time", []))
+        return job
+
+    async def compute(job: ForecastJob) -> ForecastJob | None:
+        job.forecast = await context.run_cpu_bound(
+            compute_forecast, cast(ForecastInputs, job.inputs)
+        )
+        job.inputs = None
+
+        # Handle missing forecast data
+        if not job.forecast:
+            logging.error(
+                "Failed to retrieve forecast data for %s", job.request["name"]
+            )
+            return None
+
+        return job
+
+    async def serialize(job: ForecastJob) -> ForecastJob:
+        job.body = await context.run_cpu_bound(
+            encode_forecast,
+            job.forecast,
+            config.forecast_format_version,
+            config.compress_forecasts,
+        )
+        job.forecast = None
+        return job
+
+    async def upload(job: ForecastJob) -> ForecastJob:
+        job.published = await publish_blob(
+            context,
+            job.request["output_path"],
+            cast(EncodedBody, job.body),
+            "public, max-age=1800",
+        )
+        job.body = None
+        return job
+
+    return [
+        PipelineStage("fetch", fetch, config.fetch_concurrency),
+        PipelineStage("compute", compute, config.compute_concurrency),
+        PipelineStage("serialize", serialize, config.compute_concurrency),
+        PipelineStage("upload", upload, config.upload_concurrency),
+    ]
+
+
+async def create_forecast_context(config: Config) -> ForecastContext:
+    grib_store = GribStore(config.grib_cache_dir) if config.grib_cache_dir else None
+    morphology_store = (
+        MorphologyStore(config.morphology_store_path)
+        if config.morphology_store_path
+        else None
+    )
+    coastline_index = (
+        await asyncio.to_thread(CoastlineIndex.load, config.coastline_path)
+        if config.coastline_path
+        else None
+    )
+    tide_store = TideStore(config.tide_store_dir) if config.tide_store_dir else None
+    publish_index = (
+        PublishIndex(config.publish_index_path) if config.publish_index_path else None
+    )
+    tide_harmonics = (
+        await asyncio.to_thread(TideHarmonics.load, config.tide_harmonics_path)
+        if config.tide_harmonics_path
+        else None
+    )
+    bathymetry_grid = (
+        await asyncio.to_thread(BathymetryGrid.load, config.bathymetry_path)
+        if config.bathymetry_path
+        else None
+    )
+    return ForecastContext(
+        grib_store,
+        process_pool_workers=config.process_pool_workers,
+        selective_grib_downloads=config.selective_grib_downloads,
+        cache_budget_bytes=config.cache_memory_mb * 1024 * 1024,
+        morphology_store=morphology_store,
+        coastline_index=coastline_index,
+        bathymetry_grid=bathymetry_grid,
+        tide_store=tide_store,
+        tide_harmonics=tide_harmonics,
+        publish_index=publish_index,
+        uploader=BlobUploader(config.s3_bucket, config.upload_concurrency),
+        station_catalog_path=config.station_catalog_path,
+        station_catalog_ttl=config.station_catalog_ttl_hours * 3600,
+        http_session_ttl=config.http_session_ttl_minutes * 60,
+    )
 
-        logging.info("Refreshing forecasts for locations")
-        for loc in locations_data.values():
-            try:
-                await refresh_forecast(
-                    config,
-                    context,
-                    {
-                        "output_path": f"{data_container_name}/forecast/{loc['id']}",
-                        "buoy_latitude": loc["buoy_latitude"],
-                        "buoy_longitude": loc["buoy_longitude"],
-                        "name": loc["name"],
-                        "tide_stations": loc["tide_stations"],
-                        "beach_latitude": loc["beach_latitude"],
-                        "beach_longitude": loc["beach_longitude"],
-                        "jetty_obstructions": loc["jetty_obstructions"],
-                    },
-                )
-            except Exception:
-                logging.exception("Error while generating forecast for %s", loc["name"])
 
+async def refresh_api_data(
+    config: Config,
+    context: ForecastContext,
+    forecast_urls: dict[surfpy.WaveModel, list[str]] | None = None,
+) -> dict[surfpy.WaveModel, int]:
+    """
+    Refresh the locations blob and the forecasts. With forecast_urls only the
+    locations of those wave models are refreshed, from the GRIB files given
+    for each. Returns the most forecast hours any location of each wave model
+    was computed from.
+    """
+    # Refreshes share the long-lived context, one at a time
+    async with context.refresh_lock:
+        context.begin_refresh(forecast_urls)
+        cast(BlobUploader, context.uploader).reset_stats()
+        try:
+            logging.info("Refreshing locations response blob")
+
+            # Get updated locations and upload to S3
+            locations_data = get_coastal_locations(context)
+            locations_blob = {"locations": locations_data}
+            await publish_blob(
+                context,
+                locations_blob_path,
+                EncodedBody(
+                    json.dumps(locations_blob).encode(),
+                    None,
+                    content_hash(locations_blob),
+                ),
+                "public, max-age=7200",
+            )
+
+            logging.info("Refreshing forecasts for locations")
+            locations = list(locations_data.values())
             if config.is_development:
                 # Only process a single location in development
-                break
+                locations = locations[:1]
+
+            jobs = resolve_forecast_jobs(context, locations, forecast_urls)
+            await forecast_calculation.prepare_beach_morphology(
+                context,
+                [
+                    (job.request["beach_latitude"], job.request["beach_longitude"])
+                    for job in jobs
+                ],
+            )
+
+            # One wave model at a time, so only a single model's GRIB data is
+            # held at once rather than every model's
+            pipeline = create_forecast_pipeline(config, context)
+            completed = 0
+            for wave_model, group in group_by_wave_model(jobs).items():
+                logging.info(
+                    "Refreshing %d locations on %s",
+                    len(group),
+                    wave_model.description,
+                )
+                completed += await run_pipeline(
+                    group,
+                    pipeline,
+                    queue_size=config.pipeline_queue_size,
+                    describe=lambda job: job.request["name"],
+                )
+                release_wave_model_data(context, wave_model)
+
+            logging.info(
+                "Refreshed forecasts for %d of %d locations, %d unchanged",
+                completed,
+                len(jobs),
+                sum(1 for job in jobs if job.published is False),
+            )
+
+            cast(BlobUploader, context.uploader).log_throughput()
+
+            cache_stats = context.cache.stats()
+            logging.info(
+                "Data cache: %d hits, %d coalesced, %d misses, %d evictions, %d entries using %d bytes",
+                cache_stats["hits"],
+                context.coalesced,
+                cache_stats["misses"] - context.coalesced,
+                cache_stats["evictions"],
+                cache_stats["entries"],
+                cache_stats["bytes"],
+            )
+
+            wave_hours: dict[surfpy.WaveModel, int] = {}
+            for job in jobs:
+                wave_hours[job.wave_model] = max(
+                    wave_hours.get(job.wave_model, 0), job.wave_hours
+                )
+            return wave_hours
+        finally:
+            context.end_refresh()
+            if context.publish_index:
+                await asyncio.to_thread(context.publish_index.save)
+
+
+async def refresh_new_model_cycles(
+    config: Config, context: ForecastContext, cycle_state: ModelCycleState
+):
+    """
+    Refresh the locations of every wave model whose cycle published new
+    forecast hours. A cycle is ingested progressively: its early hours are
+    published as soon as they land and later passes extend the horizon.
+    Hours already refreshed are recorded, probing them again is a no-op.
+    """
+    wave_models = [*all_wave_models, fallback_model]
+    # The HTTP session is only renewed outside the lock, hold it while probing
+    async with context.refresh_lock:
+        probes = await asyncio.gather(
+            *(
+                probe_model_cycle(context, m, forecast_calculation.FORECAST_HOURS)
+                for m in wave_models
+            )
+        )
+    progressed = [
+        (wave_model, probe[0], probe[1])
+        for wave_model, probe in zip(wave_models, probes)
+        if probe and cycle_state.is_new(wave_model, probe[0])
+    ]
+    if not progressed:
+        logging.info("No new wave model forecast hours")
+        return
+
+    for wave_model, progress, _ in progressed:
+        logging.info(
+            "Cycle %s of %s has %d forecast files published",
+            progress["cycle"],
+            wave_model.description,
+            progress["files"],
+        )
+
+    wave_hours = await refresh_api_data(
+        config, context, {m: urls for m, _, urls in progressed}
+    )
+
+    for wave_model, progress, _ in progressed:
+        # Fetches that failed are retried next time rather than recorded. Models
+        # without any locations have nothing to ingest and are recorded as is
+        if wave_model in wave_hours and wave_hours[wave_model] < progress["files"]:
+            logging.warning(
+                "Only %d of %d forecast files of %s were ingested, retrying later",
+                wave_hours[wave_model],
+                progress["files"],
+                wave_model.description,
+            )
+            continue
+
+        cycle_state.put(wave_model, progress)
+    await asyncio.to_thread(cycle_state.save)
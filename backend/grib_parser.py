@@ -1,10 +1,13 @@
 import struct
-from collections.abc import Callable
+from collections import deque
 
+import numpy as np
 import pygrib
 import surfpy
 
 GRIB_START = "GRIB".encode("ascii")
+# "GRIB", reserved bytes, discipline, edition and the 8 byte message length
+GRIB_HEADER_LENGTH = 16
 REQUIRED_SIGNALS = {
     "dirpw",
     "mpts_2",
@@ -22,68 +25,485 @@ REQUIRED_SIGNALS = {
     "wvdir",
 }
 
+# Variable and level names used by NOAA .idx inventories for the required signals
+INVENTORY_SIGNALS = {
+    ("WIND", "surface"): "ws",
+    ("WDIR", "surface"): "wdir",
+    ("HTSGW", "surface"): "swh",
+    ("PERPW", "surface"): "perpw",
+    ("DIRPW", "surface"): "dirpw",
+    ("WVHGT", "surface"): "shww",
+    ("WVPER", "surface"): "mpww",
+    ("WVDIR", "surface"): "wvdir",
+    ("SWELL", "1 in sequence"): "shts",
+    ("SWELL", "2 in sequence"): "shts_2",
+    ("SWPER", "1 in sequence"): "mpts",
+    ("SWPER", "2 in sequence"): "mpts_2",
+    ("SWDIR", "1 in sequence"): "swdir",
+    ("SWDIR", "2 in sequence"): "swdir_2",
+}
+
+# First and last byte, inclusive. No last byte reads to the end of the file
+ByteRange = tuple[int, int | None]
+
+# Half-width in degrees of the box averaged around each location
+LOCATION_RESOLUTION = 0.167
+
+
+class GridWindows:
+    """Grid-cell index windows of a set of locations on one model grid."""
+
+    def __init__(
+        self,
+        row_start: np.ndarray,
+        row_stop: np.ndarray,
+        col_start: np.ndarray,
+        col_stop: np.ndarray,
+    ):
+        self.row_start = row_start
+        self.row_stop = row_stop
+        self.col_start = col_start
+        self.col_stop = col_stop
+
+    def box_means(self, values: np.ndarray) -> np.ndarray:
+        """
+        Mean of the non-NaN values inside every window, using summed-area
+        tables so all windows are resolved with a single set of lookups.
+        Windows without any data yield 0.
+        """
+        valid = ~np.isnan(values)
+        sums = self._window_sums(summed_area_table(np.where(valid, values, 0)))
+        counts = self._window_sums(summed_area_table(valid))
+        return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+    def _window_sums(self, table: np.ndarray) -> np.ndarray:
+        return (
+            table[self.row_stop, self.col_stop]
+            - table[self.row_start, self.col_stop]
+            - table[self.row_stop, self.col_start]
+            + table[self.row_start, self.col_start]
+        )
+
+
+class PointWindows:
+    """
+    Grid points inside the box of each location, for grids that aren't regular
+    lat/lon grids (e.g. polar stereographic) and so have no axes to index.
+    """
+
+    def __init__(self, indices: list[np.ndarray]):
+        self.indices = indices
+
+    def box_means(self, values: np.ndarray) -> np.ndarray:
+        """Mean of the non-NaN values of every box, 0 for boxes without data."""
+        flat = values.reshape(-1)
+        means = np.zeros(len(self.indices))
+        for i, indices in enumerate(self.indices):
+            box = flat[indices]
+            box = box[~np.isnan(box)]
+            if len(box):
+                means[i] = box.mean()
+
+        return means
+
+
+class LocationGrid:
+    """
+    The locations forecast from one wave model. Grid windows are computed once
+    per grid and reused for every message decoded from that model.
+    """
+
+    def __init__(self, resolution: float = LOCATION_RESOLUTION):
+        self.resolution = resolution
+        self.points: list[tuple[float, float]] = []
+        self._indices: dict[tuple[float, float], int] = {}
+        self._windows: GridWindows | PointWindows | None = None
+        self._windows_key: tuple | None = None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def add(self, location: surfpy.Location) -> int:
+        point = (location.latitude, location.absolute_longitude)
+        index = self._indices.get(point)
+        if index is None:
+            index = self._indices[point] = len(self.points)
+            self.points.append(point)
+
+        return index
+
+    def windows(
+        self, latitudes: np.ndarray, longitudes: np.ndarray
+    ) -> GridWindows | PointWindows:
+        if latitudes.ndim == 2:
+            return self.point_windows(latitudes, longitudes)
+
+        key = (
+            len(self.points),
+            latitudes.shape,
+            latitudes[0],
+            latitudes[-1],
+            longitudes.shape,
+            longitudes[0],
+            longitudes[-1],
+        )
+        if self._windows is None or self._windows_key != key:
+            points = np.array(self.points, dtype=np.float64).reshape(-1, 2)
+            row_start, row_stop = axis_windows(
+                latitudes,
+                points[:, 0] - self.resolution,
+                points[:, 0] + self.resolution,
+            )
+            col_start, col_stop = axis_windows(
+                longitudes,
+                points[:, 1] - self.resolution,
+                points[:, 1] + self.resolution,
+            )
+            self._windows = GridWindows(row_start, row_stop, col_start, col_stop)
+            self._windows_key = key
+
+        return self._windows
+
+    def point_windows(
+        self, latitudes: np.ndarray, longitudes: np.ndarray
+    ) -> PointWindows:
+        """Windows on a grid given as 2-D coordinates of every grid point."""
+        # Windows of the same model share their coordinate arrays
+        key = (len(self.points), id(latitudes), id(longitudes))
+        if self._windows is None or self._windows_key != key:
+            flat_latitudes = latitudes.reshape(-1)
+            flat_longitudes = longitudes.reshape(-1)
+            self._windows = PointWindows(
+                [
+                    np.nonzero(
+                        (np.abs(flat_latitudes - latitude) <= self.resolution)
+                        & (np.abs(flat_longitudes - longitude) <= self.resolution)
+                    )[0]
+                    for latitude, longitude in self.points
+                ]
+            )
+            self._windows_key = key
+
+        return self._windows
+
+
+class DecodedGribMessage:
+    def __init__(self, time, name: str):
+        self.time = time
+        self.name = name
+        # only decoded for required signals
+        self.values: np.ndarray | None = None
+        self.latitudes = np.empty(0)
+        self.longitudes = np.empty(0)
+
 
 class GribTimeWindow:
-    def __init__(self):
+    """
+    Decoded fields of one forecast hour. Given a location grid, each field is
+    reduced to the box means of the grid's locations as it is added and then
+    dropped, so the window only holds a few values per location.
+    """
+
+    def __init__(self, grid: LocationGrid | None = None):
+        self.grid = grid
+        self.has_data = False
         self.time = ""
-        # location, resolution
-        self.data_funcs: dict[str, Callable[[surfpy.Location, float], float]] = {}
+        # grid axes shared by every field in the window
+        self.latitudes = np.empty(0)
+        self.longitudes = np.empty(0)
+        # decoded values per signal, NaN where the model has no data (land)
+        self.fields: dict[str, np.ndarray] = {}
+        self._box_means: dict[LocationGrid, tuple[int, dict[str, np.ndarray]]] = {}
+        if grid is not None:
+            self._box_means[grid] = (len(grid), {})
 
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the decoded fields and extracted box means."""
+        # 2-D coordinates are shared by every window of the grid, not counted
+        coordinates = 0
+        if self.latitudes.ndim == 1:
+            coordinates = self.latitudes.nbytes + self.longitudes.nbytes
 
-def wrap_data_func(data_func) -> float:
-    def get_result(location: surfpy.Location, location_resolution: float):
-        rawvalue, _, _ = data_func(
-            lat1=location.latitude - location_resolution,
-            lat2=location.latitude + location_resolution,
-            lon1=location.absolute_longitude - location_resolution,
-            lon2=location.absolute_longitude + location_resolution,
+        return (
+            coordinates
+            + sum(values.nbytes for values in self.fields.values())
+            + sum(
+                values.nbytes
+                for _, means in self._box_means.values()
+                for values in means.values()
+            )
         )
 
-        return rawvalue.mean().item()
+    def add(self, message: DecodedGribMessage) -> None:
+        if not self.has_data:
+            # Pull time from first grib message
+            self.time = message.time
+            self.has_data = True
 
-    return get_result
+        if message.values is None:
+            return
 
+        if self.grid is not None:
+            windows = self.grid.windows(
+                *shared_coordinates(message.latitudes, message.longitudes)
+            )
+            self._box_means[self.grid][1][message.name] = windows.box_means(
+                message.values
+            )
+            return
 
-def parse_grib_data(raw_data: bytes) -> GribTimeWindow | None:
-    if not pygrib or not raw_data or not len(raw_data):
-        return None
+        if not len(self.latitudes):
+            self.latitudes, self.longitudes = shared_coordinates(
+                message.latitudes, message.longitudes
+            )
 
-    has_grib_data = False
-    search_from = 0
-    result = GribTimeWindow()
+        self.fields[message.name] = message.values
 
-    while True:
-        startpos = raw_data.find(GRIB_START, search_from)
-        if startpos == -1:
-            # No more messages
-            break
+    def box_means(self, grid: LocationGrid) -> dict[str, np.ndarray]:
+        """Box means of every field for all locations in the grid."""
+        cached = self._box_means.get(grid)
+        if cached is not None and cached[0] == len(grid):
+            return cached[1]
 
-        lengrib = struct.unpack_from(
-            ">q",
-            buffer=raw_data,
-            # Read length after skipping GRIB header + reserved 4 bytes
-            offset=startpos + len(GRIB_START) + 4,
-        )[0]
-        search_from = startpos + lengrib
+        if self.grid is not None:
+            raise ValueError(
+                "Locations must be registered on the grid before its data is decoded"
+            )
 
-        message = pygrib.fromstring(raw_data[startpos : (startpos + lengrib)])
-        if not message:
-            continue
+        windows = grid.windows(self.latitudes, self.longitudes)
+        means = {name: windows.box_means(v) for name, v in self.fields.items()}
+        self._box_means[grid] = (len(grid), means)
+        return means
+
+
+# Grid point coordinates of the grids seen so far, keyed by their layout
+_grid_coordinates: dict[tuple, tuple[np.ndarray, np.ndarray]] = {}
+MAX_SHARED_GRIDS = 16
+
+
+def shared_coordinates(
+    latitudes: np.ndarray, longitudes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The arrays already held for an identical grid, so every time window of a
+    model refers to one copy of its 2-D coordinates. Axes are returned as is.
+    """
+    if latitudes.ndim != 2:
+        return latitudes, longitudes
+
+    key = (
+        latitudes.shape,
+        latitudes.reshape(-1)[[0, latitudes.size // 2, -1]].tobytes(),
+        longitudes.reshape(-1)[[0, longitudes.size // 2, -1]].tobytes(),
+    )
+    shared = _grid_coordinates.get(key)
+    if shared is None:
+        if len(_grid_coordinates) >= MAX_SHARED_GRIDS:
+            _grid_coordinates.clear()
+        shared = _grid_coordinates[key] = (latitudes, longitudes)
+
+    return shared
 
-        if not has_grib_data:
-            # Pull time from first grib message
-            result.time = message.validDate
 
-        has_grib_data = True
-        name = message.shortName
+def axis_windows(
+    axis: np.ndarray, low: np.ndarray, high: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Index ranges of a monotonic axis that fall within [low, high]."""
+    if len(axis) > 1 and axis[0] > axis[-1]:
+        # Latitudes are usually stored north to south
+        start, stop = axis_windows(axis[::-1], low, high)
+        return len(axis) - stop, len(axis) - start
 
-        if message.has_key("level"):
-            if message.level > 1:
-                name += "_" + str(message.level)
+    start = np.searchsorted(axis, low, side="left")
+    stop = np.searchsorted(axis, high, side="right")
+    return start, np.maximum(start, stop)
 
-        if name not in REQUIRED_SIGNALS:
+
+def summed_area_table(values: np.ndarray) -> np.ndarray:
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    return table
+
+
+def select_grib_byte_ranges(
+    inventory: str, signals: set[str] = REQUIRED_SIGNALS
+) -> list[ByteRange]:
+    """
+    Byte ranges covering the messages for the given signals, from a .idx
+    inventory ("1:0:d=2025010100:WIND:surface:anl:"). Neighbouring messages
+    are merged into a single range.
+    """
+    offsets: list[int] = []
+    selected: list[bool] = []
+    for line in inventory.splitlines():
+        fields = line.split(":")
+        if len(fields) < 5 or not fields[1].isdigit():
+            continue
+
+        offsets.append(int(fields[1]))
+        selected.append(INVENTORY_SIGNALS.get((fields[3], fields[4])) in signals)
+
+    byte_ranges: list[ByteRange] = []
+    for i, offset in enumerate(offsets):
+        if not selected[i]:
             continue
 
-        result.data_funcs[name] = wrap_data_func(message.data)
+        end = offsets[i + 1] - 1 if i + 1 < len(offsets) else None
+        if byte_ranges and byte_ranges[-1][1] == offset - 1:
+            byte_ranges[-1] = (byte_ranges[-1][0], end)
+        else:
+            byte_ranges.append((offset, end))
+
+    return byte_ranges
+
+
+def format_byte_ranges(byte_ranges: list[ByteRange]) -> str:
+    return "bytes=" + ",".join(
+        f"{start}-{'' if end is None else end}" for start, end in byte_ranges
+    )
+
+
+class GribMessageReader:
+    """
+    Splits a GRIB byte stream into complete messages as chunks arrive, so
+    messages can be decoded while the rest of the file is still downloading.
+    Received chunks are kept as they are until a message completes, which is
+    then copied out once, or not at all when it is exactly one chunk.
+    """
+
+    def __init__(self):
+        self._chunks: deque[bytes] = deque()
+        # start of the unconsumed data in the first chunk
+        self._offset = 0
+        self._size = 0
+
+    @property
+    def pending_bytes(self) -> int:
+        """Size of a message that has started but not fully arrived."""
+        return self._size if self._peek(len(GRIB_START)) == GRIB_START else 0
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        if chunk:
+            self._chunks.append(bytes(chunk))
+            self._size += len(chunk)
+
+        messages = []
+        while self._find_start():
+            header = self._peek(GRIB_HEADER_LENGTH)
+            if len(header) < GRIB_HEADER_LENGTH:
+                break
+
+            # Read length after skipping GRIB header + reserved 4 bytes
+            lengrib = struct.unpack_from(">q", header, len(GRIB_START) + 4)[0]
+            if self._size < lengrib:
+                break
+
+            messages.append(self._take(lengrib))
+
+        return messages
+
+    def _find_start(self) -> bool:
+        """Drop data before the next message, False until a marker has arrived."""
+        while self._chunks:
+            first = self._chunks[0]
+            position = first.find(GRIB_START, self._offset)
+            if position != -1:
+                self._drop(position - self._offset)
+                return True
+
+            # Keep what could be the start of a marker continued in the next chunk
+            self._drop(max(0, len(first) - self._offset - len(GRIB_START) + 1))
+            while self._chunks and self._chunks[0] is first:
+                head = self._peek(len(GRIB_START))
+                if head == GRIB_START:
+                    return True
+                if len(head) < len(GRIB_START):
+                    return False
+
+                self._drop(1)
+
+        return False
+
+    def _peek(self, size: int) -> bytes:
+        """The next size bytes (fewer if they haven't arrived), not consumed."""
+        parts = []
+        offset = self._offset
+        for chunk in self._chunks:
+            if size <= 0:
+                break
+
+            part = memoryview(chunk)[offset : offset + size]
+            parts.append(part)
+            size -= len(part)
+            offset = 0
+
+        return b"".join(parts)
+
+    def _take(self, size: int) -> bytes:
+        first = self._chunks[0]
+        if self._offset == 0 and len(first) == size:
+            data = first
+        elif self._offset + size <= len(first):
+            data = first[self._offset : self._offset + size]
+        else:
+            # pygrib needs the message as one bytes object
+            data = self._peek(size)
+
+        self._drop(size)
+        return data
+
+    def _drop(self, size: int) -> None:
+        self._size -= size
+        size += self._offset
+        while self._chunks and size >= len(self._chunks[0]):
+            size -= len(self._chunks.popleft())
+
+        self._offset = size
+
+
+def grid_axes(message) -> tuple[np.ndarray, np.ndarray]:
+    """Latitude and longitude axes of a regular lat/lon grid, in data order."""
+    latitudes = np.linspace(
+        message["latitudeOfFirstGridPointInDegrees"],
+        message["latitudeOfLastGridPointInDegrees"],
+        message["Nj"],
+    )
+    first_longitude = message["longitudeOfFirstGridPointInDegrees"]
+    last_longitude = message["longitudeOfLastGridPointInDegrees"]
+    if last_longitude < first_longitude:
+        last_longitude += 360
+
+    longitudes = np.linspace(first_longitude, last_longitude, message["Ni"])
+    return latitudes, longitudes
+
+
+def decode_grib_message(data: bytes) -> DecodedGribMessage | None:
+    if not pygrib or not data:
+        return None
+
+    message = pygrib.fromstring(data)
+    if not message:
+        return None
+
+    name = message.shortName
+
+    if message.has_key("level"):
+        if message.level > 1:
+            name += "_" + str(message.level)
+
+    result = DecodedGribMessage(message.validDate, name)
+    if name not in REQUIRED_SIGNALS:
+        return result
 
-    return result if has_grib_data else None
+    # Decode once, masked (land) cells become NaN
+    values = np.ma.asarray(message.values, dtype=np.float32)
+    result.values = np.ma.filled(values, np.nan)
+    if message.gridType == "regular_ll":
+        result.latitudes, result.longitudes = grid_axes(message)
+    else:
+        # Other projections have no lat/lon axes, keep every point's coordinates
+        latitudes, longitudes = message.latlons()
+        result.latitudes = latitudes.astype(np.float32)
+        result.longitudes = np.mod(longitudes, 360).astype(np.float32)
+    return result
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import BinaryIO, TypedDict
+
+# NOAA model URLs contain the run date and cycle hour, e.g. gfs.20250101/06/wave/...
+MODEL_CYCLE_PATTERN = re.compile(r"\.(\d{8})/(\d{2})/")
+
+
+class StoredGribMetadata(TypedDict):
+    url: str
+    etag: str | None
+    last_modified: str | None
+
+
+def get_model_cycle(url: str) -> str:
+    match = MODEL_CYCLE_PATTERN.search(url)
+    return f"{match.group(1)}{match.group(2)}" if match else "unknown"
+
+
+class GribStore:
+    """
+    Disk-backed store of downloaded GRIB files, grouped in one directory per
+    model cycle. Each file keeps the validators NOAA sent with it so it can be
+    revalidated with a conditional GET instead of downloaded again.
+    """
+
+    def __init__(self, root: str, keep_cycles: int = 2):
+        self.root = root
+        self.keep_cycles = keep_cycles
+
+    def _paths(self, url: str) -> tuple[str, str, str]:
+        cycle_dir = os.path.join(self.root, get_model_cycle(url))
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return (
+            cycle_dir,
+            os.path.join(cycle_dir, name + ".grib2"),
+            os.path.join(cycle_dir, name + ".json"),
+        )
+
+    def get_metadata(self, url: str) -> StoredGribMetadata | None:
+        _, data_path, metadata_path = self._paths(url)
+        if not os.path.exists(data_path):
+            return None
+
+        try:
+            with open(metadata_path) as fp:
+                metadata: StoredGribMetadata = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        return metadata if metadata.get("url") == url else None
+
+    def open(self, url: str) -> BinaryIO:
+        _, data_path, _ = self._paths(url)
+        return open(data_path, "rb")
+
+    def begin_write(self, url: str) -> "GribStoreWriter":
+        return GribStoreWriter(self, url)
+
+    def _commit(
+        self, url: str, temp_path: str, etag: str | None, last_modified: str | None
+    ) -> None:
+        cycle_dir, data_path, metadata_path = self._paths(url)
+        is_new_cycle = not os.path.isdir(cycle_dir)
+        os.makedirs(cycle_dir, exist_ok=True)
+
+        # Data is moved into place first so readers never see a partial file
+        os.replace(temp_path, data_path)
+        metadata: StoredGribMetadata = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        self._write_atomic(metadata_path, json.dumps(metadata).encode("utf-8"))
+
+        if is_new_cycle:
+            self.prune()
+
+    def prune(self) -> None:
+        """Remove all but the most recent model cycles."""
+        try:
+            cycles = sorted(
+                d
+                for d in os.listdir(self.root)
+                if d.isdigit() and os.path.isdir(os.path.join(self.root, d))
+            )
+        except OSError:
+            return
+
+        for cycle in cycles[: -self.keep_cycles]:
+            logging.info("Removing stored GRIB data for model cycle %s", cycle)
+            shutil.rmtree(os.path.join(self.root, cycle), ignore_errors=True)
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+class GribStoreWriter:
+    """Writes a download to a temporary file while it streams in."""
+
+    def __init__(self, store: GribStore, url: str):
+        self.store = store
+        self.url = url
+        os.makedirs(store.root, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=store.root, suffix=".tmp")
+        self.fp = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self.fp.write(chunk)
+
+    def commit(self, etag: str | None, last_modified: str | None) -> None:
+        self.fp.close()
+        self.store._commit(self.url, self.temp_path, etag, last_modified)
+
+    def discard(self) -> None:
+        self.fp.close()
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
@@ -34,6 +34,9 @@ def get_coastal_locations(context: ForecastContext) -> dict[str, LocationData]:
             for beach_location in context.known_surf_locations[surf_location]:
                 beach_location["closest_station"] = buoyStation
 
+    # beaches near the same buoy share its closest tide stations
+    buoy_tide_stations: dict[str, list[str]] = {}
+
     for buoy_location in context.known_surf_locations.values():
         for beach_location in buoy_location:
             buoyStation = beach_location.get("closest_station")
@@ -42,19 +45,21 @@ def get_coastal_locations(context: ForecastContext) -> dict[str, LocationData]:
             if not buoyStation:
                 continue
             # calculate closest tide station
-            closest_tide_stations: list[surfpy.TideStation] | list[None] | None = (
-                context.tide_stations.find_closest_stations(buoyStation.location, 2)
-            )
-
-            if not closest_tide_stations:
+            tide_stations = buoy_tide_stations.get(buoyStation.station_id)
+            if tide_stations is None:
+                closest_tide_stations = context.tide_station_index.nearest(
+                    buoyStation.location.latitude, buoyStation.location.longitude, 2
+                )
+                tide_stations = [
+                    cast(str, station.station_id)
+                    for station in closest_tide_stations
+                    if station.station_id is not None
+                ]
+                buoy_tide_stations[buoyStation.station_id] = tide_stations
+
+            if not tide_stations:
                 continue
 
-            tide_stations = [
-                cast(str, station.station_id)
-                for station in closest_tide_stations
-                if station is not None and station.station_id is not None
-            ]
-
             # set country to United States until global buoys supported
             locations_dict[id] = {
                 "id": id,
@@ -3,14 +3,21 @@ import datetime
 import logging
 import os
 import signal
+from typing import cast
 
 from apscheduler.events import JobExecutionEvent, EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from dotenv import load_dotenv
 
-from config import Config
-from function_app import refresh_api_data
+from config import REFRESH_TRIGGER_MODEL_CYCLE, Config
+from function_app import (
+    create_forecast_context,
+    refresh_api_data,
+    refresh_new_model_cycles,
+)
+from model_cycles import ModelCycleState
 
 
 def on_scheduler_executed(event: JobExecutionEvent):
@@ -30,32 +37,54 @@ async def main():
 
     app_config = Config.from_environment()
 
-    scheduler = AsyncIOScheduler()
-    scheduler.add_listener(on_scheduler_executed, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
-
-    scheduler.add_job(
-        refresh_api_data,
-        args=[app_config],
-        trigger=CronTrigger.from_crontab(
-            app_config.schedule, timezone=datetime.timezone.utc
-        ),
-    )
-
-    try:
-        wait_task = asyncio.Future()
-        loop = asyncio.get_running_loop()
-        loop.add_signal_handler(signal.SIGINT, wait_task.cancel)
-        loop.add_signal_handler(signal.SIGTERM, wait_task.cancel)
-        loop.add_signal_handler(
-            signal.SIGUSR1,
-            lambda c: asyncio.ensure_future(refresh_api_data(c)),
-            app_config,
+    # One context for the whole process, so station lists, connections and
+    # worker processes are reused across scheduled refreshes
+    async with await create_forecast_context(app_config) as context:
+        scheduler = AsyncIOScheduler()
+        scheduler.add_listener(
+            on_scheduler_executed, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR
         )
 
-        scheduler.start()
-        await wait_task
-    except asyncio.CancelledError:
-        pass
+        if app_config.refresh_trigger == REFRESH_TRIGGER_MODEL_CYCLE:
+            # Probe for new wave model forecast hours and refresh as they land
+            scheduler.add_job(
+                refresh_new_model_cycles,
+                args=[
+                    app_config,
+                    context,
+                    ModelCycleState(app_config.model_cycle_state_path),
+                ],
+                trigger=IntervalTrigger(minutes=app_config.model_cycle_poll_minutes),
+                next_run_time=datetime.datetime.now(datetime.timezone.utc),
+                max_instances=1,
+                coalesce=True,
+            )
+        else:
+            scheduler.add_job(
+                refresh_api_data,
+                args=[app_config, context],
+                trigger=CronTrigger.from_crontab(
+                    cast(str, app_config.schedule), timezone=datetime.timezone.utc
+                ),
+            )
+
+        try:
+            wait_task = asyncio.Future()
+            loop = asyncio.get_running_loop()
+            loop.add_signal_handler(signal.SIGINT, wait_task.cancel)
+            loop.add_signal_handler(signal.SIGTERM, wait_task.cancel)
+            loop.add_signal_handler(
+                signal.SIGUSR1,
+                lambda c: asyncio.ensure_future(refresh_api_data(c, context)),
+                app_config,
+            )
+
+            scheduler.start()
+            await wait_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            scheduler.shutdown(wait=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+import logging
+from collections import OrderedDict
+from typing import Callable, Hashable, TypedDict
+
+
+class CacheStats(TypedDict):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    bytes: int
+
+
+def default_sizeof(value) -> int:
+    # Decoded GRIB windows and NumPy arrays report their size as nbytes
+    return getattr(value, "nbytes", 0)
+
+
+class MemoryBoundedCache:
+    """
+    Least-recently-used cache that evicts entries once the bytes they hold
+    exceed the budget. A budget of 0 disables eviction.
+    """
+
+    def __init__(
+        self, budget_bytes: int = 0, sizeof: Callable[[object], int] = default_sizeof
+    ):
+        self.budget_bytes = budget_bytes
+        self.sizeof = sizeof
+        self.entries: OrderedDict[Hashable, tuple[object, int]] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value) -> None:
+        self.discard(key)
+
+        size = self.sizeof(value)
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+        self._evict(keep=key)
+
+    def discard(self, key: Hashable) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> CacheStats:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+        }
+
+    def _evict(self, keep: Hashable) -> None:
+        if not self.budget_bytes:
+            return
+
+        while self.total_bytes > self.budget_bytes:
+            # Never evict the entry that was just stored, nor entries that hold
+            # no measured memory (tide predictions) since dropping them frees
+            # nothing and only forces them to be fetched again
+            key = next(
+                (k for k, (_, size) in self.entries.items() if size and k != keep),
+                None,
+            )
+            if key is None:
+                return
+
+            _, size = self.entries.pop(key)
+            self.total_bytes -= size
+            self.evictions += 1
+            logging.debug("Evicted %s from cache, freeing %d bytes", key, size)
@@ -3,16 +3,29 @@ from collections import defaultdict
 import datetime
 import logging
 import math
-from typing import TypedDict, cast
+from typing import AsyncIterator, TypedDict, cast
 
 import aiohttp
+import numpy as np
 import surfpy
 
 from context import ForecastContext
-from grib_parser import GribTimeWindow, parse_grib_data
-from swell_calculations import solve_breaking_wave_heights_from_swell
+from grib_parser import (
+    ByteRange,
+    DecodedGribMessage,
+    GribMessageReader,
+    GribTimeWindow,
+    LocationGrid,
+    decode_grib_message,
+    format_byte_ranges,
+    select_grib_byte_ranges,
+)
+from grib_store import GribStore
+from swell_calculations import solve_breaking_wave_heights, swell_component_arrays
 from tide_calculations import calculate_tide_intervals
-from wave_rating import surf_quality_rating
+from tide_store import StationTides
+from time_series import asof_indices, interpolate_series, to_datetime64
+from wave_rating import surf_quality_ratings
 
 
 class HourlyForecastSummary(TypedDict):
@@ -51,14 +64,139 @@ EMPTY_FORECAST_DATA = {
 }
 
 
-async def get_response(context: ForecastContext, url: str) -> bytes:
+# Size of the pieces GRIB downloads are read and parsed in
+GRIB_CHUNK_SIZE = 1024 * 1024
+
+
+async def stream_stored_response(
+    context: ForecastContext, store_key: str
+) -> AsyncIterator[bytes]:
+    store = cast(GribStore, context.grib_store)
+    fp = await asyncio.to_thread(store.open, store_key)
+    try:
+        while chunk := await asyncio.to_thread(fp.read, GRIB_CHUNK_SIZE):
+            yield chunk
+    finally:
+        fp.close()
+
+
+async def stream_response(
+    context: ForecastContext, url: str, byte_ranges: list[ByteRange] | None = None
+) -> AsyncIterator[bytes]:
+    """
+    Yield the body of url chunk by chunk, or the given byte ranges of it one
+    after another. Stored GRIB files are revalidated and read back from disk,
+    new downloads are written to the store as they stream. Yields nothing when
+    the data could not be fetched.
+    """
+    store = context.grib_store
+    store_key = url
+    if byte_ranges is not None:
+        store_key += "#" + format_byte_ranges(byte_ranges)
+    stored = await asyncio.to_thread(store.get_metadata, store_key) if store else None
+
+    # Revalidate the stored copy rather than downloading it again
+    conditional_headers = {}
+    if stored and stored["etag"]:
+        conditional_headers["If-None-Match"] = stored["etag"]
+    if stored and stored["last_modified"]:
+        conditional_headers["If-Modified-Since"] = stored["last_modified"]
+
+    writer = None
+    etag = last_modified = None
     try:
-        async with context.http_session.get(url) as response:
+        for index, byte_range in enumerate(byte_ranges or [None]):
+            is_first = index == 0
+            headers = dict(conditional_headers) if is_first else {}
+            if byte_range:
+                headers["Range"] = format_byte_ranges([byte_range])
+
+            try:
+                response = await context.http_session.get(url, headers=headers)
+            except aiohttp.ClientError:
+                if not is_first:
+                    raise
+
+                if not (store and stored):
+                    logging.exception("Failed to fetch data from %s", url)
+                    return
+
+                logging.exception("Failed to revalidate %s, using stored copy", url)
+                async for chunk in stream_stored_response(context, store_key):
+                    yield chunk
+                return
+
+            async with response:
+                if is_first and stored and response.status == 304:
+                    async for chunk in stream_stored_response(context, store_key):
+                        yield chunk
+                    return
+
+                try:
+                    response.raise_for_status()
+                except aiohttp.ClientError:
+                    if not is_first:
+                        raise
+
+                    logging.exception("Failed to fetch data from %s", url)
+                    return
+
+                if is_first and store:
+                    writer = await asyncio.to_thread(store.begin_write, store_key)
+
+                async for chunk in response.content.iter_chunked(GRIB_CHUNK_SIZE):
+                    if writer:
+                        await asyncio.to_thread(writer.write, chunk)
+                    yield chunk
+
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                if byte_range and response.status != 206:
+                    # Range was ignored and the whole file has been sent
+                    break
+    except BaseException:
+        if writer:
+            await asyncio.to_thread(writer.discard)
+        raise
+
+    if writer:
+        await asyncio.to_thread(writer.commit, etag, last_modified)
+
+
+async def fetch_grib_byte_ranges(
+    context: ForecastContext, url: str
+) -> list[ByteRange] | None:
+    """
+    Byte ranges of the required signals in a GRIB file, read from its .idx
+    inventory. None when there is no usable inventory.
+    """
+    try:
+        async with context.http_session.get(url + ".idx") as response:
+            if response.status == 404:
+                return None
+
             response.raise_for_status()
-            return await response.read()
+            inventory = await response.text()
     except aiohttp.ClientError:
-        logging.exception("Failed to fetch data from %s", url)
-        return b""
+        logging.exception("Failed to fetch GRIB inventory for %s", url)
+        return None
+
+    byte_ranges = select_grib_byte_ranges(inventory)
+    if not byte_ranges:
+        logging.warning("No required signals listed in GRIB inventory for %s", url)
+        return None
+
+    return byte_ranges
+
+
+async def stream_grib(context: ForecastContext, url: str) -> AsyncIterator[bytes]:
+    byte_ranges = None
+    if context.selective_grib_downloads:
+        byte_ranges = await fetch_grib_byte_ranges(context, url)
+
+    # Without an inventory the whole file is downloaded
+    async for chunk in stream_response(context, url, byte_ranges):
+        yield chunk
 
 
 async def fetch_active_weather_alerts(
@@ -98,26 +236,176 @@ async def fetch_hourly_forecast_async(
 
 
 async def get_wave_model_grib(
-    context: ForecastContext, url: str
+    context: ForecastContext, url: str, grid: LocationGrid | None = None
 ) -> GribTimeWindow | None:
+    reader = GribMessageReader()
+    decodes: list[asyncio.Future[DecodedGribMessage | None]] = []
     try:
-        response = await get_response(context, url)
-        return parse_grib_data(response) if len(response) else None
+        # Decode each message as soon as it has fully arrived
+        async for chunk in stream_grib(context, url):
+            for message in reader.feed(chunk):
+                decodes.append(
+                    asyncio.ensure_future(
+                        context.run_cpu_bound(decode_grib_message, message)
+                    )
+                )
+
+        if reader.pending_bytes:
+            logging.warning(
+                "Ignoring %d bytes of incomplete GRIB data from %s",
+                reader.pending_bytes,
+                url,
+            )
+
+        # Reduced to the grid's box means as each field is added
+        result = GribTimeWindow(grid)
+        for decoded in await asyncio.gather(*decodes):
+            if decoded:
+                result.add(decoded)
+
+        return result if result.has_data else None
     except:
         logging.exception("Failed to get GRIB data from %s", url)
         return None
+    finally:
+        for decode in decodes:
+            decode.cancel()
 
 
 async def get_wave_forecast_models(
     context: ForecastContext, wave_model: surfpy.WaveModel, hours: int
 ) -> list[GribTimeWindow]:
+    # Only the hours published so far of a cycle that is still coming in, from
+    # the cycle that was probed even if the model has moved on since
+    urls = context.forecast_urls.get(wave_model) or wave_model.create_grib_urls(
+        0, hours
+    )
+
+    context.wave_model_urls.setdefault(wave_model, set()).update(urls)
+    # Every location of the model is registered before the refresh fetches,
+    # so windows only keep the box means of the grid's locations
+    grid = context.get_location_grid(wave_model)
     futures = [
-        context.get_cached_or_compute(u, get_wave_model_grib)
-        for u in wave_model.create_grib_urls(0, hours)
+        context.get_cached_or_compute(
+            u, lambda context, url: get_wave_model_grib(context, url, grid)
+        )
+        for u in urls
     ]
     grib_datas = await asyncio.gather(*futures)
-    logging.info("Wave model retrieval complete")
-    return [g for g in grib_datas if g is not None]
+    windows = [g for g in grib_datas if g is not None]
+
+    logging.info(
+        "Wave model retrieval complete, %d of %d forecast hours",
+        len(windows),
+        len(urls),
+    )
+    return windows
+
+
+def release_wave_model_data(
+    context: ForecastContext, wave_model: surfpy.WaveModel
+) -> None:
+    """Drop the model's parsed GRIB windows and location grid from the refresh."""
+    for url in context.wave_model_urls.pop(wave_model, ()):
+        context.cache.discard(url)
+    context.location_grids.pop(wave_model, None)
+
+
+async def get_station_tide_data(
+    context: ForecastContext, key: tuple[str, str]
+) -> tuple | None:
+    _, station_id = key
+    start_date = datetime.datetime.today()
+    end_date = start_date + datetime.timedelta(days=16)
+
+    # Stations with known harmonic constants are predicted locally
+    harmonics = context.tide_harmonics and context.tide_harmonics.get(station_id)
+    if harmonics:
+        return (harmonics.high_low(start_date, end_date), [])
+
+    station = context.tide_station_index.get(station_id)
+    if station is None:
+        return None
+
+    store = context.tide_store
+    if not store:
+        logging.info("Fetching tide predictions for station %s", station_id)
+        return await asyncio.to_thread(
+            station.fetch_tide_data,
+            start_date,
+            end_date,
+            interval=surfpy.TideStation.DataInterval.high_low,
+            unit=surfpy.units.Units.metric,
+        )
+
+    # Predictions don't change, only fetch the part of the window not stored yet
+    tides = await asyncio.to_thread(store.load, station_id) or StationTides.empty()
+    fetch_from = start_date
+    if len(tides.times) and tides.covered_until.astype(datetime.datetime) > start_date:
+        fetch_from = tides.covered_until.astype(datetime.datetime)
+
+    if fetch_from < end_date:
+        logging.info(
+            "Fetching tide predictions for station %s from %s",
+            station_id,
+            fetch_from.isoformat(),
+        )
+        try:
+            tide_data = await asyncio.to_thread(
+                station.fetch_tide_data,
+                fetch_from,
+                end_date,
+                interval=surfpy.TideStation.DataInterval.high_low,
+                unit=surfpy.units.Units.metric,
+            )
+        except Exception:
+            if not len(tides.times):
+                raise
+
+            logging.exception(
+                "Failed to extend tide predictions for station %s, using stored data",
+                station_id,
+            )
+        else:
+            if tide_data and tide_data[0]:
+                tides.extend(tide_data[0])
+                # keep the previous day so the window start falls between two events
+                tides.trim(start_date - datetime.timedelta(days=1))
+                await asyncio.to_thread(store.save, station_id, tides)
+            else:
+                # Coverage is kept as is so the window is fetched again next refresh
+                logging.warning(
+                    "No tide predictions returned for station %s from %s",
+                    station_id,
+                    fetch_from.isoformat(),
+                )
+
+    return (tides.events_between(start_date, end_date), [])
+
+
+async def fetch_tide_data(
+    context: ForecastContext, tide_stations: list[str] | None
+) -> tuple | None:
+    """
+    High/low tide predictions for the first station with data. Each station
+    is fetched once per refresh and shared by every beach that uses it.
+    """
+    tide_data = None
+
+    # use two tide stations - one as a backup in case the first has no data
+    for station_id in (tide_stations or [])[:2]:
+        try:
+            tide_data = await context.get_cached_or_compute(
+                ("tide", station_id), get_station_tide_data
+            )
+        except Exception:
+            logging.exception("Failed to fetch tide data for station %s", station_id)
+            continue
+
+        if tide_data and tide_data[0]:
+            break
+
+    return tide_data
 
 
 def is_data_all_zeros(data, keys):
@@ -159,26 +447,76 @@ def combined_swell_period(swell_components):
     return weighted_sum / energy_sum if energy_sum > 0 else 0
 
 
-async def retrieve_new_data(
+class ForecastInputs(TypedDict):
+    wave_model: surfpy.WaveModel
+    location: surfpy.Location
+    jetty_obstructions: list[int]
+    wave_data: dict[str, list]
+    weather_data: list[surfpy.BuoyData]
+    weather_alerts: str | None
+    tide_data: tuple | None
+
+
+async def fetch_forecast_inputs(
     context: ForecastContext,
     wave_model: surfpy.WaveModel,
     hours_to_forecast: int,
     location: surfpy.Location,
     tide_stations: list[str] | None,
     jetty_obstructions: list[int],
-) -> WaveForecastData:
-    location_resolution = 0.167
+) -> ForecastInputs:
     wave_data = defaultdict(list)
+    inputs: ForecastInputs = {
+        "wave_model": wave_model,
+        "location": location,
+        "jetty_obstructions": jetty_obstructions,
+        "wave_data": wave_data,
+        "weather_data": [],
+        "weather_alerts": None,
+        "tide_data": None,
+    }
 
-    # Retrieve grib data from NOAA for given location
-    forecast_models = await get_wave_forecast_models(
-        context, wave_model, hours_to_forecast
+    # Model, weather and tide data all come from different services, fetch
+    # them concurrently
+    forecast_models, weather_data, alerts, tide_data = await asyncio.gather(
+        get_wave_forecast_models(context, wave_model, hours_to_forecast),
+        fetch_hourly_forecast_async(location),
+        fetch_active_weather_alerts(context, location),
+        fetch_tide_data(context, tide_stations),
     )
+
+    grid = context.get_location_grid(wave_model)
+    location_index = grid.add(location)
     for m in forecast_models:
         wave_data["time"].append(m.time)
-        for key, func in m.data_funcs.items():
-            func_val = func(location, location_resolution)
-            wave_data[key].append(func_val)
+        # box means are extracted for every location on the grid at once
+        for key, values in m.box_means(grid).items():
+            wave_data[key].append(values[location_index].item())
+
+    alerts_list = alerts.get("features", [])
+    inputs["weather_data"] = weather_data
+    inputs["weather_alerts"] = (
+        alerts_list[0].get("properties", {}).get("headline", None)
+        if alerts_list
+        else None
+    )
+    inputs["tide_data"] = tide_data
+
+    return inputs
+
+
+def compute_forecast(inputs: ForecastInputs) -> WaveForecastData:
+    """
+    CPU-only half of the forecast: turns the fetched model, weather and tide
+    data into the hourly summary. Performs no I/O.
+    """
+    wave_model = inputs["wave_model"]
+    location = inputs["location"]
+    jetty_obstructions = inputs["jetty_obstructions"]
+    wave_data = inputs["wave_data"]
+    weather_data = inputs["weather_data"]
+    headline = inputs["weather_alerts"]
+    tide_data = inputs["tide_data"]
 
     # If grib data is empty return early
     if not wave_data:
@@ -203,53 +541,42 @@ async def retrieve_new_data(
         )
         return cast(WaveForecastData, {**EMPTY_FORECAST_DATA.copy()})
 
-    # Fetch weather data
-    weather_data, alerts = await asyncio.gather(
-        fetch_hourly_forecast_async(location),
-        fetch_active_weather_alerts(context, location),
+    # Join weather and tides onto the wave model hours by timestamp. Each
+    # hour gets the hourly weather period it falls in and the tide level
+    # interpolated at that time
+    wave_times = to_datetime64([x.date for x in buoy_data])
+    weather_indices = asof_indices(
+        wave_times,
+        to_datetime64([w.date for w in weather_data]),
+        tolerance=np.timedelta64(1, "h"),
     )
-
-    alerts_list = alerts.get("features", [])
-    headline = (
-        alerts_list[0].get("properties", {}).get("headline", None)
-        if alerts_list
-        else None
-    )
-
-    start_date = datetime.datetime.today()
-    end_date = start_date + datetime.timedelta(days=16)
-
-    # use two tide stations - one as a backup in case the first has no data
-    station_objects: list[surfpy.TideStation | None] = [None] * 2
-
-    for station in context.tide_stations.stations:
-        if tide_stations and station.station_id == tide_stations[0]:
-            station_objects[0] = station
-        if tide_stations and station.station_id == tide_stations[1]:
-            station_objects[1] = station
-
-    for s in station_objects:
-        if s:
-            tide_data = s.fetch_tide_data(
-                start_date,
-                end_date,
-                interval=surfpy.TideStation.DataInterval.high_low,
-                unit=surfpy.units.Units.metric,
-            )
-            if tide_data and tide_data[0]:
-                break
-
-    weather_data_index = 0
-    tide_data_iterator = 0
-    tides_with_intervals = []
+    tide_levels = None
     if tide_data and tide_data[0]:
         tides_with_intervals = calculate_tide_intervals(tide_data[0], 3)
+        if tides_with_intervals:
+            tide_levels = interpolate_series(
+                wave_times,
+                to_datetime64([t["timestamp"] for t in tides_with_intervals]),
+                [t["normalized_level"] for t in tides_with_intervals],
+            ).tolist()
+
+    # Solve breaking heights for every forecast hour in one call
+    max_heights, min_heights, no_swell = solve_breaking_wave_heights(
+        *swell_component_arrays(buoy_data), location, jetty_obstructions
+    )
+    for x, max_height, min_height, flat in zip(
+        buoy_data, max_heights.tolist(), min_heights.tolist(), no_swell.tolist()
+    ):
+        x.maximum_breaking_height = 0 if flat else max_height
+        x.minimum_breaking_height = 0 if flat else min_height
 
     hourly_forecast = []
-    for x in buoy_data:
-        solve_breaking_wave_heights_from_swell(x, location, jetty_obstructions)
-        valid_index = 0 <= weather_data_index < len(weather_data)
-        weather_entry = weather_data[weather_data_index] if valid_index else None
+    # hours that can be rated and their rating inputs, scored together at the end
+    rated_hours: list[int] = []
+    rating_inputs: list[tuple[float, float, float, float]] = []
+    for hour, x in enumerate(buoy_data):
+        weather_index = weather_indices[hour]
+        weather_entry = weather_data[weather_index] if weather_index >= 0 else None
 
         if x.maximum_breaking_height == "Invalid Incident Angle":
             return cast(WaveForecastData, {**EMPTY_FORECAST_DATA.copy()})
@@ -257,25 +584,22 @@ async def retrieve_new_data(
         swell_period = combined_swell_period(x.swell_components)
 
         if (
-            len(tides_with_intervals) > 0
+            tide_levels is not None
             and weather_entry
             and weather_entry.wind_speed is not None
         ):
-            surf_rating = surf_quality_rating(
-                x.maximum_breaking_height,
-                swell_period,
-                weather_entry.wind_speed,
-                tides_with_intervals[tide_data_iterator]["normalized_level"],
+            rated_hours.append(hour)
+            rating_inputs.append(
+                (
+                    x.maximum_breaking_height,
+                    swell_period,
+                    weather_entry.wind_speed,
+                    tide_levels[hour],
+                )
             )
-        else:
-            surf_rating = "No surf rating currently available"
 
-        # keep tide intervals up to date
-        if (
-            tide_data_iterator < (len(tides_with_intervals) - 1)
-            and x.date > tides_with_intervals[tide_data_iterator]["timestamp"]
-        ):
-            tide_data_iterator += 1
+        # replaced below for the hours that can be rated
+        surf_rating = "No surf rating currently available"
 
         hourly_forecast.append(
             {
@@ -324,6 +648,11 @@ async def retrieve_new_data(
             }
         )
 
+    if rated_hours:
+        ratings = surf_quality_ratings(*zip(*rating_inputs))
+        for hour, rating in zip(rated_hours, ratings.tolist()):
+            hourly_forecast[hour]["surf_rating"] = rating
+
     # if this is triggered still return existing wave data
     if len(weather_data) == 0:
         logging.warning(
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from typing import TypedDict
+
+import aiohttp
+import surfpy
+
+from context import ForecastContext
+from grib_store import get_model_cycle
+
+
+class CycleProgress(TypedDict):
+    cycle: str
+    # leading forecast files of the cycle published so far
+    files: int
+
+
+class ModelCycleState:
+    """
+    Progress of the model cycle last refreshed for each wave model, optionally
+    kept in a JSON file so a restart doesn't refresh the same hours again.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.cycles: dict[str, CycleProgress] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not self.path:
+            return
+
+        try:
+            with open(self.path) as fp:
+                self.cycles = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logging.exception("Failed to read model cycle state from %s", self.path)
+
+    def get(self, wave_model: surfpy.WaveModel) -> CycleProgress | None:
+        return self.cycles.get(wave_model.description)
+
+    def put(self, wave_model: surfpy.WaveModel, progress: CycleProgress) -> None:
+        self.cycles[wave_model.description] = progress
+
+    def is_new(self, wave_model: surfpy.WaveModel, progress: CycleProgress) -> bool:
+        """Whether progress is a newer cycle or more hours of the refreshed one."""
+        refreshed = self.get(wave_model)
+        return (
+            refreshed is None
+            or refreshed["cycle"] != progress["cycle"]
+            or refreshed["files"] < progress["files"]
+        )
+
+    def save(self) -> None:
+        if not self.path:
+            return
+
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first so a crash never leaves a partial file
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(self.cycles, fp, indent=2)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+async def is_published(context: ForecastContext, url: str) -> bool:
+    try:
+        async with context.http_session.head(url, allow_redirects=True) as response:
+            return response.status == 200
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.debug("Probe of %s failed: %s", url, e)
+        return False
+
+
+async def count_published(context: ForecastContext, urls: list[str]) -> int:
+    """
+    Number of leading urls that are published. NOAA publishes the files of a
+    cycle in forecast hour order, so the boundary is found by bisection.
+    """
+    if not urls or not await is_published(context, urls[0]):
+        return 0
+    if await is_published(context, urls[-1]):
+        return len(urls)
+
+    # urls[low - 1] is published and urls[high] is not
+    low, high = 1, len(urls) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if await is_published(context, urls[middle]):
+            low = middle + 1
+        else:
+            high = middle
+
+    return low
+
+
+async def probe_model_cycle(
+    context: ForecastContext, wave_model: surfpy.WaveModel, hours: int
+) -> tuple[CycleProgress, list[str]] | None:
+    """
+    Cycle the model's forecast files currently point at, how many of its files
+    are published so far and their urls. None until the first forecast hour is.
+    """
+    urls = wave_model.create_grib_urls(0, hours)
+    files = await count_published(context, urls)
+    if not files:
+        if urls:
+            logging.debug(
+                "Cycle %s of %s is not published yet",
+                get_model_cycle(urls[0]),
+                wave_model.description,
+            )
+        return None
+
+    return {"cycle": get_model_cycle(urls[0]), "files": files}, urls[:files]
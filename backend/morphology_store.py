@@ -0,0 +1,169 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import NotRequired, TypedDict
+
+# Bump when the way depth, slope or orientation are derived changes so stored
+# results from the old method are recomputed
+MORPHOLOGY_VERSION = 1
+
+
+class BeachMorphology(TypedDict):
+    depth: float
+    slope: float
+    orientation: float
+    # the beach couldn't be measured and got the fallback values, kept so it
+    # isn't measured again on every refresh until invalidated
+    fallback: NotRequired[bool]
+
+
+def get_beach_key(beach_lat: float, beach_lon: float) -> str:
+    return f"{beach_lat},{beach_lon}"
+
+
+class MorphologyStore:
+    """
+    Versioned JSON store of measured beach morphology keyed by beach
+    coordinates. Coastline and bathymetry don't change between refreshes, so
+    each beach is only measured again once its entry is invalidated.
+
+    The file is the source of truth: it is read again whenever it changed on
+    disk, so invalidating entries from another process reaches a running
+    service instead of being overwritten by its next save.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.beaches: dict[str, BeachMorphology] = {}
+        # modification time of the file the entries were last read from
+        self.mtime: float | None = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def _file_mtime(self) -> float | None:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _reload_if_changed(self) -> None:
+        if self._file_mtime() != self.mtime:
+            self.load()
+
+    def load(self) -> None:
+        self.beaches = {}
+        self.mtime = self._file_mtime()
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logging.exception("Failed to read beach morphology from %s", self.path)
+            return
+
+        if data.get("version") != MORPHOLOGY_VERSION:
+            logging.info(
+                "Discarding beach morphology stored with version %s",
+                data.get("version"),
+            )
+            return
+
+        self.beaches = data.get("beaches", {})
+
+    def get(self, beach_lat: float, beach_lon: float) -> BeachMorphology | None:
+        with self._lock:
+            self._reload_if_changed()
+            return self.beaches.get(get_beach_key(beach_lat, beach_lon))
+
+    def put(
+        self, beach_lat: float, beach_lon: float, morphology: BeachMorphology
+    ) -> None:
+        with self._lock:
+            self._reload_if_changed()
+            self.beaches[get_beach_key(beach_lat, beach_lon)] = morphology
+            self._save()
+
+    def put_many(self, beaches: list[tuple[float, float, BeachMorphology]]) -> None:
+        with self._lock:
+            self._reload_if_changed()
+            for beach_lat, beach_lon, morphology in beaches:
+                self.beaches[get_beach_key(beach_lat, beach_lon)] = morphology
+            self._save()
+
+    def invalidate(self, beach_lat: float, beach_lon: float) -> bool:
+        with self._lock:
+            self._reload_if_changed()
+            removed = self.beaches.pop(get_beach_key(beach_lat, beach_lon), None)
+            if removed:
+                self._save()
+
+            return removed is not None
+
+    def invalidate_fallbacks(self) -> int:
+        """Remove the beaches that got fallback values, returns how many."""
+        with self._lock:
+            self._reload_if_changed()
+            fallbacks = [k for k, v in self.beaches.items() if v.get("fallback")]
+            for key in fallbacks:
+                del self.beaches[key]
+            if fallbacks:
+                self._save()
+
+            return len(fallbacks)
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self.beaches = {}
+            self._save()
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first so a crash never leaves a partial file
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                json.dump(
+                    {"version": MORPHOLOGY_VERSION, "beaches": self.beaches},
+                    fp,
+                    indent=2,
+                )
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        self.mtime = self._file_mtime()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Invalidate stored beach morphology")
+    parser.add_argument("path", help="morphology store file")
+    parser.add_argument(
+        "beaches",
+        nargs="*",
+        metavar="LAT,LON",
+        help="beaches to invalidate, all beaches when omitted",
+    )
+    parser.add_argument(
+        "--fallbacks",
+        action="store_true",
+        help="only invalidate beaches that couldn't be measured",
+    )
+    args = parser.parse_args()
+
+    store = MorphologyStore(args.path)
+    if args.fallbacks:
+        print(f"Invalidated {store.invalidate_fallbacks()} fallback beaches")
+    elif not args.beaches:
+        store.invalidate_all()
+
+    for beach in args.beaches:
+        lat, lon = (float(v) for v in beach.split(","))
+        if not store.invalidate(lat, lon):
+            print(f"No stored morphology for {beach}")
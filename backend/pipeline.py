@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+# Marks the end of a stage's input; one is queued per downstream worker
+_DONE = object()
+
+
+class PipelineStage(Generic[T]):
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[T], Awaitable[T | None]],
+        concurrency: int = 1,
+    ):
+        if concurrency < 1:
+            raise ValueError("pipeline stage concurrency must be at least 1")
+
+        self.name = name
+        # Returning None drops the item from the rest of the pipeline
+        self.func = func
+        self.concurrency = concurrency
+
+
+async def run_pipeline(
+    items: Iterable[T],
+    stages: list[PipelineStage[T]],
+    queue_size: int,
+    describe: Callable[[T], str] = str,
+) -> int:
+    """
+    Push items through the stages in order. Each stage runs its own pool of
+    workers and hands results to the next stage through a bounded queue, so a
+    slow stage applies back pressure instead of letting items pile up in memory.
+
+    Failures are logged and only drop the item that caused them.
+    Returns the number of items that made it through every stage.
+    """
+    if not stages:
+        return 0
+
+    queues: list[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    remaining_workers = [stage.concurrency for stage in stages]
+    completed = 0
+
+    async def close_stage(index: int):
+        for _ in range(stages[index].concurrency):
+            await queues[index].put(_DONE)
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        await close_stage(0)
+
+    async def work(index: int):
+        nonlocal completed
+        stage = stages[index]
+        is_last = index == len(stages) - 1
+
+        while True:
+            item = await queues[index].get()
+            if item is _DONE:
+                break
+
+            try:
+                result = await stage.func(item)
+            except Exception:
+                logging.exception(
+                    "Pipeline stage %s failed for %s", stage.name, describe(item)
+                )
+                continue
+
+            if result is None:
+                continue
+
+            if is_last:
+                completed += 1
+            else:
+                await queues[index + 1].put(result)
+
+        remaining_workers[index] -= 1
+        if remaining_workers[index] == 0 and not is_last:
+            await close_stage(index + 1)
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(feed())
+        for index, stage in enumerate(stages):
+            for _ in range(stage.concurrency):
+                group.create_task(work(index))
+
+    return completed
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# Seconds an entry is trusted before it is checked against the bucket again
+RECONCILE_INTERVAL = 24 * 3600
+
+
+class PublishIndex:
+    """
+    Content hash of every blob last uploaded, kept in a local JSON file so
+    unchanged blobs aren't uploaded again. Changes are written by save().
+
+    Entries are checked against the bucket on their first use in a process
+    and then once every reconcile interval, so blobs deleted or overwritten
+    in the bucket are uploaded again.
+    """
+
+    def __init__(self, path: str, reconcile_interval: float = RECONCILE_INTERVAL):
+        self.path = path
+        self.hashes: dict[str, str] = {}
+        self.reconcile_interval = reconcile_interval
+        # monotonic time each key was last checked against the bucket
+        self.reconciled: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as fp:
+                self.hashes = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logging.exception("Failed to read publish index from %s", self.path)
+
+    def get(self, key: str) -> str | None:
+        return self.hashes.get(key)
+
+    def needs_reconcile(self, key: str) -> bool:
+        reconciled = self.reconciled.get(key)
+        return (
+            reconciled is None
+            or time.monotonic() - reconciled > self.reconcile_interval
+        )
+
+    def reconcile(self, key: str, content_hash: str | None) -> None:
+        """Record the hash the bucket holds for key, None when it has no blob."""
+        if content_hash:
+            if self.hashes.get(key) != content_hash:
+                self.put(key, content_hash)
+        else:
+            self.discard(key)
+        self.reconciled[key] = time.monotonic()
+
+    def put(self, key: str, content_hash: str) -> None:
+        with self._lock:
+            self.hashes[key] = content_hash
+            self._dirty = True
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            if self.hashes.pop(key, None) is not None:
+                self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+
+            # Write to a temporary file first so a crash never leaves a partial file
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as fp:
+                    json.dump(self.hashes, fp)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+
+            self._dirty = False
@@ -0,0 +1,80 @@
+import logging
+import os
+import pickle
+import tempfile
+import time
+
+import surfpy
+
+from station_index import StationIndex
+
+# Bump when the snapshot layout changes so old snapshots are fetched again
+SNAPSHOT_VERSION = 1
+
+
+class StationCatalog:
+    """NOAA buoy and tide station lists, with the tide stations indexed."""
+
+    def __init__(
+        self,
+        buoy_stations: surfpy.BuoyStations,
+        tide_stations: surfpy.TideStations,
+        fetched_at: float,
+    ):
+        self.buoy_stations = buoy_stations
+        self.tide_stations = tide_stations
+        # wall clock time the lists were downloaded, kept across restarts
+        self.fetched_at = fetched_at
+        self.tide_station_index = StationIndex(tide_stations.stations)
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    @staticmethod
+    def fetch() -> "StationCatalog":
+        logging.info("Fetching buoy and tide station lists")
+        buoy_stations = surfpy.BuoyStations()
+        buoy_stations.fetch_stations()
+        tide_stations = surfpy.TideStations()
+        tide_stations.fetch_stations()
+        return StationCatalog(buoy_stations, tide_stations, time.time())
+
+    @staticmethod
+    def load(path: str) -> "StationCatalog | None":
+        try:
+            with open(path, "rb") as fp:
+                data = pickle.load(fp)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.exception("Failed to read station catalog snapshot %s", path)
+            return None
+
+        if data.get("version") != SNAPSHOT_VERSION:
+            return None
+
+        return StationCatalog(
+            data["buoy_stations"], data["tide_stations"], data["fetched_at"]
+        )
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first so a crash never leaves a partial file
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(
+                    {
+                        "version": SNAPSHOT_VERSION,
+                        "fetched_at": self.fetched_at,
+                        "buoy_stations": self.buoy_stations,
+                        "tide_stations": self.tide_stations,
+                    },
+                    fp,
+                )
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -0,0 +1,104 @@
+import heapq
+from typing import Generic, TypeVar
+
+import numpy as np
+
+# Stations checked one by one once a tree node holds this few
+LEAF_SIZE = 8
+
+TStation = TypeVar("TStation")
+
+
+def unit_vectors(lats, lons) -> np.ndarray:
+    """
+    Points on the unit sphere. Straight-line distances between them order
+    exactly like great circle distances, without longitude wrap-around.
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.stack(
+        (np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)),
+        axis=-1,
+    )
+
+
+class StationIndex(Generic[TStation]):
+    """
+    KD-tree over the locations of surfpy stations for nearest station lookups,
+    with the stations also indexed by ID.
+    """
+
+    def __init__(self, stations: list[TStation]):
+        self.stations = [s for s in stations if getattr(s, "location", None)]
+        self.by_id: dict[str, TStation] = {
+            s.station_id: s for s in self.stations if s.station_id is not None
+        }
+
+        self.points = unit_vectors(
+            [s.location.latitude for s in self.stations],
+            [s.location.longitude for s in self.stations],
+        ).reshape(-1, 3)
+
+        # Nodes are (axis, split, left, right) for branches and
+        # (-1, 0, start, end) ranges of self.order for leaves
+        self.order = np.arange(len(self.stations))
+        self.nodes: list[tuple[int, float, int, int]] = []
+        if len(self.stations):
+            self._build(0, len(self.stations))
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def get(self, station_id: str) -> TStation | None:
+        return self.by_id.get(station_id)
+
+    def _build(self, start: int, end: int) -> int:
+        node = len(self.nodes)
+        if end - start <= LEAF_SIZE:
+            self.nodes.append((-1, 0.0, start, end))
+            return node
+
+        # Split the widest axis at its median
+        points = self.points[self.order[start:end]]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        middle = (end - start) // 2
+        partition = np.argpartition(points[:, axis], middle)
+        self.order[start:end] = self.order[start:end][partition]
+        split = float(self.points[self.order[start + middle], axis])
+
+        self.nodes.append((axis, split, 0, 0))
+        left = self._build(start, start + middle)
+        right = self._build(start + middle, end)
+        self.nodes[node] = (axis, split, left, right)
+        return node
+
+    def nearest(self, lat: float, lon: float, count: int = 1) -> list[TStation]:
+        """Up to count stations closest to the point, nearest first."""
+        if not self.nodes or count < 1:
+            return []
+
+        query = unit_vectors(lat, lon)
+        # max-heap of the best candidates so far as (-squared distance, index)
+        best: list[tuple[float, int]] = []
+
+        def visit(node: int) -> None:
+            axis, split, left, right = self.nodes[node]
+            if axis < 0:
+                indices = self.order[left:right]
+                distances = ((self.points[indices] - query) ** 2).sum(axis=1)
+                for distance, index in zip(distances.tolist(), indices.tolist()):
+                    if len(best) < count:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+                return
+
+            offset = query[axis] - split
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            # The far side can only hold closer stations if the split plane is closer
+            if len(best) < count or offset * offset < -best[0][0]:
+                visit(far)
+
+        visit(0)
+        return [self.stations[index] for _, index in sorted(best, reverse=True)]
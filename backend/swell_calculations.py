@@ -1,9 +1,13 @@
+import functools
 import logging
 import math
 from typing import cast
 
+import numpy as np
 import surfpy
 
+GRAVITY = 9.81
+
 
 def classify_wind_relative_to_beach(wind_dir, beach_angle):
     """
@@ -130,3 +134,187 @@ def solve_breaking_wave_heights_from_swell(
     # Restore original units
     if old_unit != buoydata.unit:
         buoydata.change_units(old_unit)
+
+
+def swell_component_arrays(
+    buoy_data: list[surfpy.BuoyData],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Metric height, period and direction of every swell component as
+    (hour x component) arrays padded with NaN, plus each hour's component count.
+    """
+    counts = np.array([len(x.swell_components or []) for x in buoy_data], dtype=int)
+    shape = (len(buoy_data), int(counts.max(initial=0)))
+    heights = np.full(shape, np.nan)
+    periods = np.full(shape, np.nan)
+    directions = np.full(shape, np.nan)
+
+    for hour, x in enumerate(buoy_data):
+        old_unit = x.unit
+        if x.unit != surfpy.units.Units.metric:
+            x.change_units(surfpy.units.Units.metric)
+
+        for component, swell in enumerate(x.swell_components or []):
+            heights[hour, component] = swell.wave_height
+            periods[hour, component] = swell.period
+            directions[hour, component] = swell.direction
+
+        if old_unit != x.unit:
+            x.change_units(old_unit)
+
+    return heights, periods, directions, counts
+
+
+def dispersion_wavelengths(periods: np.ndarray, depth) -> np.ndarray:
+    """Linear dispersion wavelength of each period at the depth, by Newton's method."""
+    deep_wavelengths = GRAVITY * periods**2 / (2 * np.pi)
+    # Solve kh * tanh(kh) = k0h for the relative depth kh
+    k0h = 2 * np.pi * depth / deep_wavelengths
+    kh = np.where(k0h < 1, np.sqrt(k0h), k0h)
+    for _ in range(20):
+        tanh = np.tanh(kh)
+        kh = kh - (kh * tanh - k0h) / (tanh + kh * (1 - tanh**2))
+
+    return 2 * np.pi * depth / kh
+
+
+def breaking_wave_heights(
+    periods: np.ndarray,
+    incident_angles: np.ndarray,
+    heights: np.ndarray,
+    depth,
+) -> np.ndarray:
+    """
+    Array form of the breaking height from surfpy.tools.breaking_characteristics:
+    the deep water height is refracted to the depth with Snell's law, then
+    broken with Komar and Gaughan's formula.
+    """
+    celerities = dispersion_wavelengths(periods, depth) / periods
+    deep_celerities = GRAVITY * periods / (2 * np.pi)
+
+    angles = np.radians(incident_angles)
+    refracted_angles = np.arcsin(np.sin(angles) * celerities / deep_celerities)
+    refraction = np.sqrt(np.cos(angles) / np.cos(refracted_angles))
+
+    return 0.39 * GRAVITY**0.2 * (periods * (heights * refraction) ** 2) ** 0.4
+
+
+@functools.cache
+def breaking_wave_heights_match_surfpy() -> bool:
+    """
+    Whether breaking_wave_heights agrees with the installed surfpy, checked
+    once per process. A surfpy with different formulas falls back to it.
+    """
+    periods, angles, heights, slopes, depths = (
+        a.ravel()
+        for a in np.meshgrid(
+            [5.0, 9.0, 15.0], [0.0, 35.0, 70.0], [0.5, 2.0], [0.01, 0.08], [3.0, 15.0]
+        )
+    )
+    try:
+        expected = np.array(
+            [
+                surfpy.tools.breaking_characteristics(p, a, h, s, d)[0]
+                for p, a, h, s, d in zip(periods, angles, heights, slopes, depths)
+            ],
+            dtype=np.float64,
+        )
+    except (TypeError, ValueError):
+        expected = None
+
+    matches = expected is not None and np.allclose(
+        breaking_wave_heights(periods, angles, heights, depths), expected, rtol=1e-3
+    )
+    if not matches:
+        logging.warning(
+            "Installed surfpy breaks waves differently, solving swells one at a time"
+        )
+
+    return matches
+
+
+def solve_breaking_wave_heights(
+    heights: np.ndarray,
+    periods: np.ndarray,
+    directions: np.ndarray,
+    counts: np.ndarray,
+    location: surfpy.Location,
+    jetty_obstructions: list[int] | None = None,
+    wind_speeds: np.ndarray | None = None,
+    wind_directions: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    solve_breaking_wave_heights_from_swell over (hour x component) arrays from
+    swell_component_arrays. Returns the maximum and minimum breaking heights
+    of every hour, and which hours had no swell facing the beach (their
+    heights are 0 with no wind or jetty adjustment, like the scalar solver).
+
+    Breaking heights come from breaking_wave_heights for all swells at once,
+    or from one surfpy call per swell if the installed surfpy disagrees.
+    """
+    present = np.arange(heights.shape[1]) < counts[:, None]
+
+    # Incident angle of every swell, ignoring swells coming from behind the beach
+    incident_angles = np.abs(directions - location.angle) % 360
+    incident_angles = np.where(
+        incident_angles > 180, 360 - incident_angles, incident_angles
+    )
+    # NaN angles are not compared as behind the beach, matching the scalar solver
+    valid = present & ~(incident_angles > 90)
+
+    # Breaking height of each valid swell with the 0.8 breaking coefficient
+    breaking_heights = np.zeros(heights.shape)
+    if breaking_wave_heights_match_surfpy():
+        breaking_heights[valid] = 0.8 * breaking_wave_heights(
+            periods[valid], incident_angles[valid], heights[valid], location.depth
+        )
+    else:
+        for hour, component in zip(*np.nonzero(valid)):
+            wave_breaking_height, _ = surfpy.tools.breaking_characteristics(
+                periods[hour, component],
+                incident_angles[hour, component],
+                heights[hour, component],
+                location.slope,
+                location.depth,
+            )
+            breaking_heights[hour, component] = 0.8 * wave_breaking_height
+
+    # Combine using quadrature sum: total surf energy from all swells
+    no_swell = ~valid.any(axis=1)
+    combined_breaking_heights = np.sqrt((breaking_heights**2).sum(axis=1))
+
+    # Wind adjustment, no wind counts as calm wind from the north
+    if wind_speeds is None:
+        wind_speeds = np.zeros(len(heights))
+    if wind_directions is None:
+        wind_directions = np.zeros(len(heights))
+
+    relative_angles = (wind_directions - location.angle) % 360
+    relative_angles = np.where(
+        relative_angles > 180, 360 - relative_angles, relative_angles
+    )
+    onshore = relative_angles <= 45
+    sideshore = ~onshore & (relative_angles <= 135)
+    offshore = ~onshore & ~sideshore
+    wind_penalties = np.where(
+        wind_speeds >= 13,
+        np.select([onshore, sideshore], [-0.4, -0.15], 0.1),
+        np.where(offshore, 0.2, 0.0),
+    )
+    combined_breaking_heights += wind_penalties
+    min_heights = combined_breaking_heights / 1.4
+
+    # Jetty shadowing is judged on the direction of each hour's last swell
+    if jetty_obstructions and heights.shape[1]:
+        last_directions = directions[np.arange(len(heights)), np.maximum(counts - 1, 0)]
+        differences = np.abs(
+            last_directions[:, None] - np.asarray(jetty_obstructions)[None, :]
+        )
+        shadowed = (np.minimum(differences, 360 - differences) <= 90).any(axis=1)
+        factors = np.where(shadowed, 0.7, 1.0)
+        combined_breaking_heights *= factors
+        min_heights *= factors
+
+    combined_breaking_heights[no_swell] = 0
+    min_heights[no_swell] = 0
+    return combined_breaking_heights, min_heights, no_swell
@@ -0,0 +1,82 @@
+import itertools
+
+import numpy as np
+import pytest
+
+surfpy = pytest.importorskip("surfpy")
+
+from swell_calculations import (
+    breaking_wave_heights,
+    solve_breaking_wave_heights,
+    solve_breaking_wave_heights_from_swell,
+    swell_component_arrays,
+)
+
+HEIGHTS = [0.3, 1.0, 2.5, 5.0]
+PERIODS = [4.0, 8.0, 12.0, 18.0]
+ANGLES = [0.0, 20.0, 45.0, 70.0, 89.0]
+
+
+def create_location(depth: float, slope: float) -> surfpy.Location:
+    return surfpy.Location(
+        latitude=40.0,
+        longitude=-74.0,
+        altitude=0,
+        name="test",
+        depth=depth,
+        angle=120.0,
+        slope=slope,
+    )
+
+
+def create_buoy_data(swells: list[tuple[float, float, float]]) -> surfpy.BuoyData:
+    data = surfpy.BuoyData(surfpy.units.Units.metric)
+    data.swell_components = [
+        surfpy.Swell(
+            surfpy.units.Units.metric,
+            wave_height=height,
+            period=period,
+            direction=direction,
+        )
+        for height, period, direction in swells
+    ]
+    return data
+
+
+@pytest.mark.parametrize("depth,slope", [(3.0, 0.08), (10.0, 0.02), (25.0, 0.01)])
+def test_breaking_wave_heights_match_surfpy(depth, slope):
+    heights, periods, angles = (
+        np.array(v, dtype=np.float64)
+        for v in zip(*itertools.product(HEIGHTS, PERIODS, ANGLES))
+    )
+    expected = [
+        surfpy.tools.breaking_characteristics(p, a, h, slope, depth)[0]
+        for h, p, a in zip(heights, periods, angles)
+    ]
+
+    np.testing.assert_allclose(
+        breaking_wave_heights(periods, angles, heights, depth), expected, rtol=1e-3
+    )
+
+
+@pytest.mark.parametrize("jetty_obstructions", [None, [90]])
+def test_solver_matches_scalar_solver(jetty_obstructions):
+    location = create_location(10.0, 0.02)
+    # one and two swell hours, directions relative to the 120 degree beach
+    swells = [
+        (height, period, 120.0 + angle)
+        for height, period, angle in itertools.product(HEIGHTS, PERIODS, ANGLES)
+    ]
+    buoy_data = [create_buoy_data([swell]) for swell in swells]
+    buoy_data += [create_buoy_data([a, b]) for a, b in zip(swells, swells[::-1])]
+    buoy_data.append(create_buoy_data([(1.0, 10.0, 300.0)]))
+
+    max_heights, min_heights, no_swell = solve_breaking_wave_heights(
+        *swell_component_arrays(buoy_data), location, jetty_obstructions
+    )
+
+    for i, data in enumerate(buoy_data):
+        solve_breaking_wave_heights_from_swell(data, location, jetty_obstructions)
+        assert max_heights[i] == pytest.approx(data.maximum_breaking_height, rel=1e-3)
+        assert min_heights[i] == pytest.approx(data.minimum_breaking_height, rel=1e-3)
+    assert no_swell[-1]
@@ -0,0 +1,74 @@
+import datetime
+
+import numpy as np
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from tide_harmonics import (
+    StationHarmonics,
+    astronomical_arguments,
+    fetch_station_harmonics,
+)
+
+NOAA_DATA_API = "https://api.tidesandcurrents.noaa.gov/api/prod/datagetter"
+
+# San Francisco, a mixed tide with strong diurnal constituents
+STATION_ID = "9414290"
+
+
+def test_mean_sun_hour_angle_is_zero_at_noon():
+    times = np.array(
+        ["2000-01-01T00:00:00", "2000-01-01T12:00:00", "2025-06-01T06:00:00"],
+        dtype="datetime64[s]",
+    )
+    tau, s, h = astronomical_arguments(times)[:, :3].T
+
+    # tau = T + h - s, so T is the hour angle of the mean sun
+    hour_angles = (tau + s - h) % 360
+    np.testing.assert_allclose(hour_angles, [180, 0, 270], atol=1e-6)
+
+
+def fetch_noaa_high_low(start: datetime.datetime, end: datetime.datetime) -> list:
+    response = requests.get(
+        NOAA_DATA_API,
+        params={
+            "product": "predictions",
+            "interval": "hilo",
+            "datum": "MSL",
+            "station": STATION_ID,
+            "begin_date": start.strftime("%Y%m%d"),
+            "end_date": end.strftime("%Y%m%d"),
+            "time_zone": "gmt",
+            "units": "metric",
+            "format": "json",
+        },
+        timeout=30,
+    )
+    response.raise_for_status()
+    return [
+        (datetime.datetime.strptime(p["t"], "%Y-%m-%d %H:%M"), float(p["v"]), p["type"])
+        for p in response.json()["predictions"]
+    ]
+
+
+def test_high_low_matches_noaa_predictions():
+    start = datetime.datetime(2025, 1, 1)
+    end = datetime.datetime(2025, 1, 4)
+    try:
+        station = fetch_station_harmonics(STATION_ID)
+        expected = fetch_noaa_high_low(start, end)
+    except requests.RequestException as e:
+        pytest.skip(f"NOAA API unavailable: {e}")
+
+    # Compare against MSL predictions, so no datum offset
+    harmonics = StationHarmonics.from_dict({**station, "datum_offset": 0.0})
+    events = harmonics.high_low(
+        start - datetime.timedelta(hours=1), end + datetime.timedelta(days=1)
+    )
+
+    for time, level, event_type in expected:
+        closest = min(events, key=lambda e: abs(e.date - time))
+        assert closest.tidal_event == event_type
+        assert abs(closest.date - time) <= datetime.timedelta(minutes=20)
+        assert closest.water_level == pytest.approx(level, abs=0.1)
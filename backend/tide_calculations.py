@@ -1,3 +1,15 @@
+import datetime
+
+
+class TideEvent:
+    """High or low tide, shaped like surfpy's tide events."""
+
+    def __init__(self, date: datetime.datetime, water_level: float, tidal_event: str):
+        self.date = date
+        self.water_level = water_level
+        self.tidal_event = tidal_event
+
+
 def calculate_tide_intervals(tide_events, hour_interval_hours):
     """
     Interpolates tide levels between known tide events at a specified interval (in hours),
@@ -0,0 +1,293 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import requests
+
+from tide_calculations import TideEvent
+
+NOAA_STATION_API = "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations"
+
+# Doodson numbers multiplying (tau, s, h, p, N', p1) and the phase offset in
+# degrees giving each constituent's equilibrium argument, after Schureman.
+# The node factor column names the constituent whose nodal modulation applies.
+CONSTITUENTS: dict[str, tuple[tuple[int, ...], float, str]] = {
+    "M2": ((2, 0, 0, 0, 0, 0), 0, "M2"),
+    "S2": ((2, 2, -2, 0, 0, 0), 0, "none"),
+    "N2": ((2, -1, 0, 1, 0, 0), 0, "M2"),
+    "K1": ((1, 1, 0, 0, 0, 0), -90, "K1"),
+    "M4": ((4, 0, 0, 0, 0, 0), 0, "M2^2"),
+    "O1": ((1, -1, 0, 0, 0, 0), 90, "O1"),
+    "M6": ((6, 0, 0, 0, 0, 0), 0, "M2^3"),
+    "MK3": ((3, 1, 0, 0, 0, 0), -90, "M2*K1"),
+    "S4": ((4, 4, -4, 0, 0, 0), 0, "none"),
+    "MN4": ((4, -1, 0, 1, 0, 0), 0, "M2^2"),
+    "NU2": ((2, -1, 2, -1, 0, 0), 0, "M2"),
+    "S6": ((6, 6, -6, 0, 0, 0), 0, "none"),
+    "MU2": ((2, -2, 2, 0, 0, 0), 0, "M2"),
+    "2N2": ((2, -2, 0, 2, 0, 0), 0, "M2"),
+    "OO1": ((1, 3, 0, 0, 0, 0), -90, "OO1"),
+    "LAM2": ((2, 1, -2, 1, 0, 0), 180, "M2"),
+    "J1": ((1, 2, 0, -1, 0, 0), -90, "J1"),
+    "MM": ((0, 1, 0, -1, 0, 0), 0, "MM"),
+    "SSA": ((0, 0, 2, 0, 0, 0), 0, "none"),
+    "SA": ((0, 0, 1, 0, 0, 0), 0, "none"),
+    "MSF": ((0, 2, -2, 0, 0, 0), 0, "-M2"),
+    "MF": ((0, 2, 0, 0, 0, 0), 0, "MF"),
+    "RHO1": ((1, -2, 2, -1, 0, 0), 90, "O1"),
+    "Q1": ((1, -2, 0, 1, 0, 0), 90, "O1"),
+    "T2": ((2, 2, -3, 0, 0, 1), 0, "none"),
+    "R2": ((2, 2, -1, 0, 0, -1), 180, "none"),
+    "2Q1": ((1, -3, 0, 2, 0, 0), 90, "O1"),
+    "P1": ((1, 1, -2, 0, 0, 0), 90, "none"),
+    "2SM2": ((2, 4, -4, 0, 0, 0), 0, "-M2"),
+    "M3": ((3, 0, 0, 0, 0, 0), 180, "M2^1.5"),
+    "L2": ((2, 1, 0, -1, 0, 0), 180, "M2"),
+    "2MK3": ((3, -1, 0, 0, 0, 0), 90, "M2^2/K1"),
+    "K2": ((2, 2, 0, 0, 0, 0), 0, "K2"),
+    "M8": ((8, 0, 0, 0, 0, 0), 0, "M2^4"),
+    "MS4": ((4, 2, -2, 0, 0, 0), 0, "M2"),
+}
+
+# NOAA spells some constituents differently
+CONSTITUENT_ALIASES = {"RHO": "RHO1"}
+
+J2000 = np.datetime64("2000-01-01T12:00:00", "s")
+
+
+def astronomical_arguments(times: np.ndarray) -> np.ndarray:
+    """
+    Mean lunar time and the mean longitudes of the moon, sun, lunar perigee,
+    lunar node (negated) and solar perigee at each time, in degrees.
+    """
+    hours = (times.astype("datetime64[s]") - J2000).astype(np.float64) / 3600
+    centuries = hours / (24 * 36525)
+
+    s = 218.3164477 + 481267.88123421 * centuries
+    h = 280.46646 + 36000.76983 * centuries
+    p = 83.3532465 + 4069.0137287 * centuries
+    n = 125.04452 - 1934.136261 * centuries
+    p1 = 282.93735 + 1.71946 * centuries
+    # hour angle of the mean sun at Greenwich, zero at noon (when J2000 falls)
+    mean_solar_time = 15 * hours
+    tau = mean_solar_time + h - s
+
+    return np.stack((tau, s, h, p, -n, p1), axis=-1) % 360
+
+
+def node_factors(node_longitude: float) -> dict[str, tuple[float, float]]:
+    """Amplitude factor f and phase correction u of the nodally modulated constituents."""
+    n = np.radians(node_longitude)
+
+    def factor(f_terms, u_terms):
+        f = f_terms[0] + sum(c * np.cos(k * n) for k, c in enumerate(f_terms[1:], 1))
+        u = sum(c * np.sin(k * n) for k, c in enumerate(u_terms, 1))
+        return float(f), float(u)
+
+    m2 = factor((1.0004, -0.0373, 0.0002), (-2.14,))
+    k1 = factor((1.0060, 0.1150, -0.0088, 0.0006), (-8.86, 0.68, -0.07))
+
+    return {
+        "none": (1.0, 0.0),
+        "M2": m2,
+        "-M2": (m2[0], -m2[1]),
+        "M2^1.5": (m2[0] ** 1.5, 1.5 * m2[1]),
+        "M2^2": (m2[0] ** 2, 2 * m2[1]),
+        "M2^3": (m2[0] ** 3, 3 * m2[1]),
+        "M2^4": (m2[0] ** 4, 4 * m2[1]),
+        "K1": k1,
+        "M2*K1": (m2[0] * k1[0], m2[1] + k1[1]),
+        "M2^2/K1": (m2[0] ** 2 * k1[0], 2 * m2[1] - k1[1]),
+        "O1": factor((1.0089, 0.1871, -0.0147, 0.0014), (10.80, -1.34, 0.19)),
+        "OO1": factor((1.1027, 0.6504, 0.0317, -0.0014), (-36.68, 4.02, -0.57)),
+        "J1": factor((1.1029, 0.1676, -0.0170, 0.0016), (-12.94, 1.34, -0.19)),
+        "K2": factor((1.0241, 0.2863, 0.0083, -0.0015), (-17.74, 0.68, -0.04)),
+        "MF": factor((1.043, 0.414), (-23.7, 2.7, -0.4)),
+        "MM": factor((1.0, -0.130), ()),
+    }
+
+
+class StationHarmonics:
+    """Harmonic constants of one station, amplitudes in meters and phases in degrees (GMT)."""
+
+    def __init__(
+        self,
+        names: list[str],
+        amplitudes: np.ndarray,
+        phases: np.ndarray,
+        datum_offset: float = 0.0,
+    ):
+        self.names = names
+        self.amplitudes = np.asarray(amplitudes, dtype=np.float64)
+        self.phases = np.asarray(phases, dtype=np.float64)
+        # mean sea level above the chart datum the predictions are given in
+        self.datum_offset = datum_offset
+        self.doodson = np.array(
+            [CONSTITUENTS[n][0] for n in names], dtype=np.float64
+        ).reshape(-1, 6)
+        self.phase_offsets = np.array([CONSTITUENTS[n][1] for n in names])
+
+    @staticmethod
+    def from_dict(data: dict) -> "StationHarmonics":
+        names, amplitudes, phases = [], [], []
+        for constituent in data["constituents"]:
+            name = CONSTITUENT_ALIASES.get(constituent["name"], constituent["name"])
+            if name not in CONSTITUENTS:
+                logging.debug("Ignoring unsupported tide constituent %s", name)
+                continue
+
+            names.append(name)
+            amplitudes.append(constituent["amplitude"])
+            phases.append(constituent["phase"])
+
+        return StationHarmonics(
+            names, amplitudes, phases, data.get("datum_offset", 0.0)
+        )
+
+    def water_levels(self, times: np.ndarray) -> np.ndarray:
+        """Predicted water level in meters at each time (UTC)."""
+        times = np.asarray(times, dtype="datetime64[s]")
+        arguments = astronomical_arguments(times)
+
+        # Nodal modulation barely moves within a forecast window, use its middle
+        middle = arguments[len(arguments) // 2] if len(arguments) else None
+        factors = node_factors(-middle[4] if middle is not None else 0.0)
+        f = np.array([factors[CONSTITUENTS[n][2]][0] for n in self.names])
+        u = np.array([factors[CONSTITUENTS[n][2]][1] for n in self.names])
+
+        # (times, constituents) matrix of equilibrium arguments
+        angles = arguments @ self.doodson.T + self.phase_offsets + u - self.phases
+        return self.datum_offset + np.cos(np.radians(angles)) @ (f * self.amplitudes)
+
+    def high_low(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        step_minutes: int = 6,
+    ) -> list[TideEvent]:
+        """High and low tides between start and end (UTC), like NOAA's hilo predictions."""
+        times = np.arange(
+            np.datetime64(start, "s"),
+            np.datetime64(end, "s") + 1,
+            np.timedelta64(step_minutes * 60, "s"),
+        )
+        levels = self.water_levels(times)
+        if len(levels) < 3:
+            return []
+
+        # Turning points are where the slope changes sign between samples
+        slopes = np.sign(np.diff(levels))
+        turns = np.nonzero(slopes[:-1] != slopes[1:])[0] + 1
+        turns = turns[(slopes[turns - 1] != 0) & (slopes[turns] != 0)]
+
+        # Refine each turning point with a parabola through its neighbours
+        before, at, after = levels[turns - 1], levels[turns], levels[turns + 1]
+        curvature = before - 2 * at + after
+        offsets = np.divide(
+            0.5 * (before - after),
+            curvature,
+            out=np.zeros_like(curvature),
+            where=curvature != 0,
+        )
+        event_levels = at - 0.25 * (before - after) * offsets
+        event_times = times[turns] + np.round(offsets * step_minutes * 60).astype(
+            "timedelta64[s]"
+        )
+
+        return [
+            TideEvent(time.astype(datetime.datetime), level, "H" if is_high else "L")
+            for time, level, is_high in zip(
+                event_times, event_levels.tolist(), (curvature < 0).tolist()
+            )
+        ]
+
+
+class TideHarmonics:
+    """
+    Harmonic constants of tide stations loaded from a JSON data file:
+    {"stations": {"<station id>": {"datum_offset": 0.7, "constituents":
+    [{"name": "M2", "amplitude": 0.6, "phase": 8.2}, ...]}}}
+    """
+
+    def __init__(self, stations: dict[str, StationHarmonics]):
+        self.stations = stations
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def get(self, station_id: str) -> StationHarmonics | None:
+        return self.stations.get(station_id)
+
+    @staticmethod
+    def load(path: str) -> "TideHarmonics":
+        with open(path) as fp:
+            data = json.load(fp)
+
+        return TideHarmonics(
+            {
+                station_id: StationHarmonics.from_dict(station)
+                for station_id, station in data.get("stations", {}).items()
+            }
+        )
+
+
+def fetch_station_harmonics(station_id: str) -> dict:
+    """Harmonic constants and MSL above MLLW of a station from NOAA's metadata API."""
+    response = requests.get(
+        f"{NOAA_STATION_API}/{station_id}/harcon.json",
+        params={"units": "metric"},
+        timeout=30,
+    )
+    response.raise_for_status()
+    constituents = [
+        {"name": c["name"], "amplitude": c["amplitude"], "phase": c["phase_GMT"]}
+        for c in response.json().get("HarmonicConstituents") or []
+        if c.get("amplitude")
+    ]
+
+    response = requests.get(
+        f"{NOAA_STATION_API}/{station_id}/datums.json",
+        params={"units": "metric"},
+        timeout=30,
+    )
+    response.raise_for_status()
+    datums = {d["name"]: d["value"] for d in response.json().get("datums") or []}
+    datum_offset = (
+        datums["MSL"] - datums["MLLW"] if "MSL" in datums and "MLLW" in datums else 0.0
+    )
+
+    return {"datum_offset": datum_offset, "constituents": constituents}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add NOAA harmonic constants of tide stations to a data file"
+    )
+    parser.add_argument("path", help="tide harmonics data file")
+    parser.add_argument("stations", nargs="+", metavar="STATION_ID")
+    args = parser.parse_args()
+
+    try:
+        with open(args.path) as fp:
+            data = json.load(fp)
+    except FileNotFoundError:
+        data = {"stations": {}}
+
+    for station_id in args.stations:
+        station = fetch_station_harmonics(station_id)
+        if not station["constituents"]:
+            print(f"No harmonic constants published for station {station_id}")
+            continue
+
+        data["stations"][station_id] = station
+
+    directory = os.path.dirname(args.path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as fp:
+        json.dump(data, fp, indent=2)
+    os.replace(temp_path, args.path)
+    print(f"Saved harmonic constants of {len(data['stations'])} stations")
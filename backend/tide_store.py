@@ -0,0 +1,119 @@
+import datetime
+import os
+import tempfile
+
+import numpy as np
+
+from tide_calculations import TideEvent
+
+
+class StationTides:
+    """Tide predictions of one station held as compact parallel arrays."""
+
+    def __init__(
+        self,
+        times: np.ndarray,
+        levels: np.ndarray,
+        events: np.ndarray,
+        covered_until: np.datetime64,
+    ):
+        self.times = times.astype("datetime64[s]")
+        self.levels = levels.astype(np.float32)
+        self.events = events.astype("U1")
+        # predictions have been retrieved up to here
+        self.covered_until = np.datetime64(covered_until, "s")
+
+    @staticmethod
+    def empty() -> "StationTides":
+        return StationTides(
+            np.empty(0, dtype="datetime64[s]"),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype="U1"),
+            np.datetime64("NaT", "s"),
+        )
+
+    def extend(self, tide_events: list) -> None:
+        """
+        Append events newer than the last one stored. Coverage only moves up
+        to the last event returned, so a truncated fetch is resumed from there.
+        """
+        if not tide_events:
+            return
+
+        times = np.array([e.date for e in tide_events], dtype="datetime64[s]")
+        newer = times > self.times[-1] if len(self.times) else np.ones_like(times, bool)
+
+        self.times = np.concatenate((self.times, times[newer]))
+        self.levels = np.concatenate(
+            (
+                self.levels,
+                np.array([e.water_level for e in tide_events], np.float32)[newer],
+            )
+        )
+        self.events = np.concatenate(
+            (self.events, np.array([e.tidal_event for e in tide_events], "U1")[newer])
+        )
+        self.covered_until = self.times[-1]
+
+    def trim(self, before: datetime.datetime) -> None:
+        """Drop events that can no longer be part of a forecast window."""
+        keep = self.times >= np.datetime64(before, "s")
+        self.times = self.times[keep]
+        self.levels = self.levels[keep]
+        self.events = self.events[keep]
+
+    def events_between(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> list[TideEvent]:
+        selected = (self.times >= np.datetime64(start, "s")) & (
+            self.times <= np.datetime64(end, "s")
+        )
+        return [
+            TideEvent(time.astype(datetime.datetime), level, event)
+            for time, level, event in zip(
+                self.times[selected],
+                self.levels[selected].tolist(),
+                self.events[selected].tolist(),
+            )
+        ]
+
+
+class TideStore:
+    """Per-station tide predictions kept on disk as .npz files."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, station_id: str) -> str:
+        return os.path.join(self.root, f"{station_id}.npz")
+
+    def load(self, station_id: str) -> StationTides | None:
+        try:
+            with np.load(self._path(station_id)) as data:
+                return StationTides(
+                    data["times"],
+                    data["levels"],
+                    data["events"],
+                    data["covered_until"][()],
+                )
+        except FileNotFoundError:
+            return None
+
+    def save(self, station_id: str, tides: StationTides) -> None:
+        os.makedirs(self.root, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                np.savez(
+                    fp,
+                    times=tides.times,
+                    levels=tides.levels,
+                    events=tides.events,
+                    covered_until=tides.covered_until,
+                )
+            os.replace(temp_path, self._path(station_id))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -0,0 +1,67 @@
+import datetime
+
+import numpy as np
+
+
+def to_datetime64(dates) -> np.ndarray:
+    """
+    Timestamps as a datetime64[s] array, NaT for missing ones. Aware datetimes
+    are converted to UTC, naive ones are taken as UTC already.
+    """
+    return np.array(
+        [
+            (
+                d.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                if d is not None and d.tzinfo is not None
+                else d
+            )
+            for d in dates
+        ],
+        dtype="datetime64[s]",
+    ).reshape(-1)
+
+
+def asof_indices(
+    times: np.ndarray,
+    source_times: np.ndarray,
+    tolerance: np.timedelta64 | None = None,
+) -> np.ndarray:
+    """
+    Index of the latest source entry at or before each time, or -1 when there
+    is none (or it is more than tolerance older). Source times need not be
+    sorted, indices refer to their original order.
+    """
+    result = np.full(len(times), -1, dtype=np.int64)
+    known = ~np.isnat(source_times)
+    if not known.any():
+        return result
+
+    positions = np.nonzero(known)[0]
+    order = positions[np.argsort(source_times[known], kind="stable")]
+    sorted_times = source_times[order]
+
+    found = np.searchsorted(sorted_times, times, side="right") - 1
+    matched = (found >= 0) & ~np.isnat(times)
+    if tolerance is not None:
+        matched &= times - sorted_times[np.maximum(found, 0)] < tolerance
+
+    result[matched] = order[found[matched]]
+    return result
+
+
+def interpolate_series(
+    times: np.ndarray, source_times: np.ndarray, values
+) -> np.ndarray:
+    """
+    Source values linearly interpolated at each time, held at the first and
+    last value outside the source range. NaN when the source is empty.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    known = ~np.isnat(source_times) & ~np.isnan(values)
+    if not known.any():
+        return np.full(len(times), np.nan)
+
+    order = np.argsort(source_times[known], kind="stable")
+    source_seconds = source_times[known][order].astype(np.int64)
+    result = np.interp(times.astype(np.int64), source_seconds, values[known][order])
+    return np.where(np.isnat(times), np.nan, result)
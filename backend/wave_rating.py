@@ -1,3 +1,10 @@
+import numpy as np
+
+RATING_LABELS = np.array(["Poor", "Fair", "Good", "Epic"])
+# Lowest total score of each label after "Poor"
+RATING_SCORE_THRESHOLDS = (3, 5, 7)
+
+
 def surf_quality_rating(
     wave_height: float | None,
     swell_period: float | None,
@@ -62,3 +69,51 @@ def score_wind_speed(knots):
         return 1  # light wind
     else:
         return 0  # choppy or blown out
+
+
+def surf_quality_ratings(
+    wave_heights, swell_periods, wind_speeds, tide_levels
+) -> np.ndarray:
+    """
+    Batch form of surf_quality_rating over equally sized arrays, returning
+    the label of every entry. Missing values score like NaN in the scalar
+    helpers.
+    """
+    scores = (
+        score_wave_heights(wave_heights)
+        + score_swell_periods(swell_periods)
+        + score_wind_speeds(wind_speeds)
+        + score_tide_levels(tide_levels)
+    )
+    return RATING_LABELS[np.searchsorted(RATING_SCORE_THRESHOLDS, scores, "right")]
+
+
+def as_float_array(values) -> np.ndarray:
+    return np.array(values, dtype=np.float64)
+
+
+def score_tide_levels(normalized_tides) -> np.ndarray:
+    tides = as_float_array(normalized_tides)
+    return np.select(
+        [
+            (0.4 <= tides) & (tides <= 0.6),
+            ((0.25 <= tides) & (tides < 0.4)) | ((0.6 < tides) & (tides <= 0.75)),
+        ],
+        [2, 1],
+        0,
+    )
+
+
+def score_wave_heights(heights_ft) -> np.ndarray:
+    heights = as_float_array(heights_ft)
+    return np.select([heights < 1.5, heights <= 4.5, heights <= 7], [0, 2, 1], 0)
+
+
+def score_swell_periods(periods_s) -> np.ndarray:
+    periods = as_float_array(periods_s)
+    return np.select([periods < 8, periods < 11], [0, 1], 2)
+
+
+def score_wind_speeds(knots) -> np.ndarray:
+    speeds = as_float_array(knots)
+    return np.select([speeds <= 6, speeds <= 12], [2, 1], 0)
@@ -41,6 +41,7 @@ export interface ForecastData {
   tide_forecast: TidalForecast[];
   surf_rating: string;
   swell_period: number;
+  format_version?: number;
 }
 
 // Base url for blob storage direct access endpoints
@@ -63,6 +64,15 @@ function formatTime(date: string) {
   });
 }
 
+// Columnar forecasts (format_version 2) store each series as arrays per field
+function columnsToRows<T>(columns: { [key: string]: any[] }): T[] {
+  const keys = Object.keys(columns);
+  const length = keys.length ? columns[keys[0]].length : 0;
+  return Array.from({ length }, (_, i) =>
+    Object.fromEntries(keys.map((key) => [key, columns[key][i]]))
+  ) as T[];
+}
+
 // Retrieve location data from blob storage
 export async function getLocations() {
   const response = await fetch(`${storageBaseUrl}/locations`);
@@ -88,6 +98,10 @@ export async function getForecast(
   }
 
   const data: ForecastData = await response.json();
+  if (data?.format_version === 2) {
+    data.hourly_forecast = columnsToRows(data.hourly_forecast as any);
+    data.tide_forecast = columnsToRows(data.tide_forecast as any);
+  }
   if (data?.hourly_forecast?.[0]?.min_breaking_height == null) {
     return { error: "No forecast data available for this location" };
   }